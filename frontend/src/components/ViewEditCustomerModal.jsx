@@ -69,6 +69,17 @@ const ViewEditCustomerModal = ({ customer, type, onClose }) => {
     return dateString;
   };
 
+  const [invoices, setInvoices] = useState([]);
+
+  // Invoices are no longer copied into the customer; fetch them by customer
+  useEffect(() => {
+    if (!customer || !isView) return;
+    fetch(`http://72.61.171.226:8000/api/customers/${customer.id}/invoices/?fields=number,date,total,status`)
+      .then(response => response.ok ? response.json() : [])
+      .then(setInvoices)
+      .catch(() => setInvoices([]));
+  }, [customer, isView]);
+
   useEffect(() => {
     if (customer) {
       setFormData({
@@ -265,11 +276,11 @@ const ViewEditCustomerModal = ({ customer, type, onClose }) => {
                 </div>
               </div>
 
-              {customer.invoices && customer.invoices.length > 0 && (
+              {invoices.length > 0 && (
                 <div className="modal-form-section">
                   <h4>Recent Invoices</h4>
                   <div className="invoice-list">
-                    {customer.invoices.map((invoice, index) => (
+                    {invoices.map((invoice, index) => (
                       <div key={index} className="invoice-item">
                         <div className="invoice-info">
                           <div className="invoice-number" style={{ textAlign: 'left' }}>{invoice.number}</div>
@@ -280,7 +291,7 @@ const ViewEditCustomerModal = ({ customer, type, onClose }) => {
                             fontFamily: "'Courier New', monospace",
                             fontWeight: '600'
                           }}>
-                            AED {formatNumber(invoice.amount)}
+                            AED {formatNumber(invoice.total)}
                           </div>
                           <span className={`invoice-status status-${invoice.status}`}>
                             {invoice.status?.charAt(0).toUpperCase() + invoice.status?.slice(1)}
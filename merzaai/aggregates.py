@@ -0,0 +1,279 @@
+"""
+Running totals maintained by merzaai.store alongside a collection.
+
+Like the indexes in merzaai.indexes, an aggregate is told about every record
+that enters or leaves its collection, so reading it is O(1) no matter how
+many records there are. Amounts are summed as Decimal to avoid drift from
+repeatedly adding and subtracting floats.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from .dates import month_of
+
+# "INV-CUST-0042" is number 42 under the prefix "INV-CUST-"
+_NUMBER = re.compile(r'(.*?)(\d+)')
+
+
+def _amount(value):
+    try:
+        return Decimal(str(float(value or 0)))
+    except (TypeError, ValueError, InvalidOperation):
+        return Decimal(0)
+
+
+class InvoiceTotals:
+    """Invoice count and total amount per status."""
+
+    name = 'invoice_totals'
+
+    def __init__(self):
+        self._by_status = {}
+
+    def build(self, records):
+        self._by_status = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        entry = self._by_status.setdefault(record.get('status'), [0, Decimal(0)])
+        entry[0] += 1
+        entry[1] += _amount(record.get('total'))
+
+    def remove(self, record):
+        entry = self._by_status.get(record.get('status'))
+        if entry is None:
+            return
+        entry[0] -= 1
+        entry[1] -= _amount(record.get('total'))
+        if entry[0] <= 0:
+            del self._by_status[record.get('status')]
+
+    def summary(self):
+        return _invoice_summary(self._by_status)
+
+
+def _invoice_summary(by_status):
+    """Totals of {status: [count, total]}."""
+    count = sum(entry[0] for entry in by_status.values())
+    sales = sum((entry[1] for entry in by_status.values()), Decimal(0))
+    paid_count, paid = by_status.get('paid', (0, Decimal(0)))
+    return {
+        'count': count,
+        'sales': float(sales),
+        'paidCount': paid_count,
+        'cashCollected': float(paid),
+        'receivables': float(sales - paid),
+        'byStatus': {
+            status: {'count': entry[0], 'total': float(entry[1])}
+            for status, entry in by_status.items()
+        },
+    }
+
+
+class MonthlyInvoiceRollup:
+    """
+    Invoice count and total per (month, status, customer), by invoice date.
+    Invoices without a date are left out.
+    """
+
+    name = 'monthly_invoices'
+    # Every month and customer: too large to send with every change event
+    in_events = False
+
+    def __init__(self):
+        # (year, month) -> (status, customer id) -> [count, total]
+        self._months = {}
+
+    def build(self, records):
+        self._months = {}
+        for record in records:
+            self.add(record)
+
+    def _cell(self, record):
+        ordinal = record.get('dateOrdinal')
+        if ordinal is None:
+            return None, None
+        return month_of(ordinal), (record.get('status'), record.get('customer_id'))
+
+    def add(self, record):
+        month, key = self._cell(record)
+        if month is None:
+            return
+        entry = self._months.setdefault(month, {}).setdefault(key, [0, Decimal(0)])
+        entry[0] += 1
+        entry[1] += _amount(record.get('total'))
+
+    def remove(self, record):
+        month, key = self._cell(record)
+        cells = self._months.get(month)
+        if cells is None or key not in cells:
+            return
+        entry = cells[key]
+        entry[0] -= 1
+        entry[1] -= _amount(record.get('total'))
+        if entry[0] <= 0:
+            del cells[key]
+            if not cells:
+                del self._months[month]
+
+    def summary(self, start=None, end=None, customer_id=None):
+        """
+        (year, month) -> the InvoiceTotals summary of that month, for the
+        months within [start, end] that have invoices, optionally of one
+        customer only.
+        """
+        result = {}
+        for month, cells in self._months.items():
+            if (start is not None and month < start) or (end is not None and month > end):
+                continue
+            by_status = {}
+            for (status, customer), (count, total) in cells.items():
+                if customer_id is not None and customer != customer_id:
+                    continue
+                entry = by_status.setdefault(status, [0, Decimal(0)])
+                entry[0] += count
+                entry[1] += total
+            if by_status:
+                result[month] = _invoice_summary(by_status)
+        return result
+
+
+class CustomerInvoiceTotals:
+    """Invoice count and total amount per customer_id."""
+
+    name = 'customer_invoices'
+    # One entry per customer: too large to send with every change event
+    in_events = False
+
+    def __init__(self):
+        self._by_customer = {}
+
+    def build(self, records):
+        self._by_customer = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        customer_id = record.get('customer_id')
+        if customer_id is None:
+            return
+        entry = self._by_customer.setdefault(customer_id, [0, Decimal(0)])
+        entry[0] += 1
+        entry[1] += _amount(record.get('total'))
+
+    def remove(self, record):
+        entry = self._by_customer.get(record.get('customer_id'))
+        if entry is None:
+            return
+        entry[0] -= 1
+        entry[1] -= _amount(record.get('total'))
+        if entry[0] <= 0:
+            del self._by_customer[record.get('customer_id')]
+
+    def summary(self, customer_ids=None):
+        """customer id -> {totalInvoices, totalAmount}, for every customer or the given ones."""
+        if customer_ids is None:
+            customer_ids = self._by_customer
+        result = {}
+        for customer_id in customer_ids:
+            count, total = self._by_customer.get(customer_id, (0, Decimal(0)))
+            result[customer_id] = {'totalInvoices': count, 'totalAmount': float(total)}
+        return result
+
+
+class NumberSequence:
+    """
+    The numbers in use per prefix in a field such as the invoice number. The
+    store numbers a new record from a sequence its storage persists per
+    prefix, so that a deleted record's number is never issued again; the
+    highest number in use is the floor of that sequence, covering records
+    written without it (e.g. imported ones).
+    """
+
+    name = 'numbers'
+    in_events = False
+
+    def __init__(self, field):
+        self.field = field
+        # prefix -> {number: records using it}
+        self._by_prefix = {}
+        self._highest = {}
+
+    def build(self, records):
+        self._by_prefix = {}
+        self._highest = {}
+        for record in records:
+            self.add(record)
+
+    def _split(self, record):
+        match = _NUMBER.fullmatch(str(record.get(self.field) or ''))
+        return (match[1], int(match[2])) if match else (None, None)
+
+    def add(self, record):
+        prefix, number = self._split(record)
+        if prefix is None:
+            return
+        numbers = self._by_prefix.setdefault(prefix, {})
+        numbers[number] = numbers.get(number, 0) + 1
+        if number > self._highest.get(prefix, 0):
+            self._highest[prefix] = number
+
+    def remove(self, record):
+        prefix, number = self._split(record)
+        numbers = self._by_prefix.get(prefix)
+        if not numbers or number not in numbers:
+            return
+        numbers[number] -= 1
+        if numbers[number] > 0:
+            return
+        del numbers[number]
+        if not numbers:
+            del self._by_prefix[prefix]
+            del self._highest[prefix]
+        elif number == self._highest[prefix]:
+            self._highest[prefix] = max(numbers)
+
+    def highest(self, prefix):
+        return self._highest.get(prefix, 0)
+
+    def format(self, prefix, number):
+        return f"{prefix}{number:04d}"
+
+    def summary(self):
+        """prefix -> highest number in use."""
+        return dict(self._highest)
+
+
+class LeadStats:
+    """Lead count per status, for the conversion rate."""
+
+    name = 'lead_stats'
+
+    def __init__(self):
+        self._by_status = {}
+
+    def build(self, records):
+        self._by_status = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        status = record.get('status')
+        self._by_status[status] = self._by_status.get(status, 0) + 1
+
+    def remove(self, record):
+        status = record.get('status')
+        if status in self._by_status:
+            self._by_status[status] -= 1
+            if self._by_status[status] <= 0:
+                del self._by_status[status]
+
+    def summary(self):
+        count = sum(self._by_status.values())
+        won = self._by_status.get('won', 0)
+        return {
+            'count': count,
+            'won': won,
+            'byStatus': dict(self._by_status),
+        }
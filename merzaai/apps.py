@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MerzaaiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'merzaai'
+
+    def ready(self):
+        from . import store
+        # Finish multi-collection writes a crashed worker left half done
+        store.recover()
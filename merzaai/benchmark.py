@@ -0,0 +1,415 @@
+"""
+Synthetic data and a load driver for benchmarking the API.
+
+    manage.py benchmark --scale 100000 --concurrency 8 --requests 50 --output bench.json
+
+generate() writes leads, customers, invoices (with line items and their
+customer_id; the store derives each customer's invoice totals from them),
+payments and a chart of accounts, as the JSON files the store reads, from a
+seeded random generator: the same scale and seed always give the same data.
+
+run() sends each of SCENARIOS `requests` times from `concurrency` threads,
+through Django's test client or over HTTP to a running server, and reports
+p50/p95/p99 latency and requests per second per scenario. Scenarios run in
+order, reads first, then writes, then deletes, so the reads always see the
+generated data. Delete scenarios first ask the list endpoint for the ids
+they will delete.
+"""
+import csv
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from django.urls import Resolver404, get_resolver, resolve
+
+from .store import COLLECTIONS
+
+# Generated dates fall in the three years up to END_DATE; fixed so that
+# runs on different days see the same data
+END_DATE = date(2025, 12, 31)
+DAYS = 3 * 365
+
+FIRST_NAMES = ('John', 'Sarah', 'Michael', 'Emily', 'David', 'Lisa', 'James', 'Aisha', 'Omar', 'Priya')
+LAST_NAMES = ('Smith', 'Johnson', 'Brown', 'Chen', 'Rodriguez', 'Wilson', 'Khan', 'Patel', 'Garcia', 'Lee')
+COMPANY_WORDS = (
+    'Global', 'Prime', 'Innovate', 'Cloud', 'Edu', 'Green', 'Blue', 'Smart', 'Rapid', 'Nova',
+    'Tech', 'Solutions', 'Labs', 'Systems', 'Logistics', 'Health', 'Foods', 'Energy', 'Media', 'Capital',
+)
+INDUSTRIES = ('Technology', 'Healthcare', 'Education', 'Retail', 'Manufacturing', 'Finance')
+SOURCES = ('website', 'referral', 'event', 'cold-call', 'social')
+LEAD_STATUSES = ('new', 'contacted', 'qualified', 'proposal', 'won', 'lost')
+INVOICE_STATUSES = ('paid', 'paid', 'sent', 'overdue', 'draft')
+SERVICES = ('Consulting', 'Cloud Migration Services', 'Support Plan', 'Training', 'Licence', 'Integration')
+ACCOUNT_TYPES = ('Asset', 'Liability', 'Equity', 'Income', 'Expense')
+ACCOUNTS = 50
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _company(rng):
+    return f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)} {rng.randint(1, 999)}"
+
+
+def _day(rng):
+    return END_DATE - timedelta(days=rng.randrange(DAYS))
+
+
+def _person(rng, record_id):
+    name = _name(rng)
+    company = _company(rng)
+    return {
+        'id': record_id,
+        'name': name,
+        'company': company,
+        'title': rng.choice(('CEO', 'CTO', 'IT Director', 'Purchasing Manager', 'Founder')),
+        'email': f"{name.split()[0].lower()}.{record_id}@example.com",
+        'phone': f"+971 {rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        'address': f"{rng.randint(1, 999)} Business Ave\nDubai",
+        'addedDate': _day(rng).strftime('%B %d, %Y'),
+        'notes': ' '.join(rng.choices(SERVICES + COMPANY_WORDS, k=8)),
+    }
+
+
+def _lead(rng, lead_id):
+    lead = _person(rng, lead_id)
+    lead.update({
+        'source': rng.choice(SOURCES),
+        'status': rng.choice(LEAD_STATUSES),
+        'lastContact': _day(rng).strftime('%B %d, %Y'),
+        'industry': rng.choice(INDUSTRIES),
+        'annualRevenue': rng.choice(('$1M - $5M', '$5M - $25M', '$25M - $50M', '$50M - $100M')),
+    })
+    return lead
+
+
+def _invoice(rng, invoice_id, customer_id, customer):
+    items = []
+    for _ in range(rng.randint(1, 3)):
+        quantity = rng.randint(1, 50)
+        price = rng.choice((50, 75, 100, 125, 250, 500))
+        items.append({
+            'description': rng.choice(SERVICES), 'quantity': quantity,
+            'price': price, 'amount': quantity * price,
+        })
+    subtotal = sum(item['amount'] for item in items)
+    vat = round(subtotal * 0.05, 2)
+    day = _day(rng)
+    return {
+        'id': invoice_id,
+        'number': f"INV-{invoice_id:07d}",
+        'customer': f"{customer['company']} - {customer['name']}",
+        'customer_id': customer_id,
+        'customer_company': customer['company'],
+        'date': day.isoformat(),
+        'dueDate': (day + timedelta(days=30)).isoformat(),
+        'status': rng.choice(INVOICE_STATUSES),
+        'items': items,
+        'subtotal': subtotal,
+        'vat': vat,
+        'total': subtotal + vat,
+    }
+
+
+def _write(directory, name, records):
+    """Stream records into the collection's JSON file, one record per line."""
+    filename, key, _ = COLLECTIONS[name]
+    count = 0
+    with open(os.path.join(directory, filename), 'w') as f:
+        f.write('{"%s": [\n' % key)
+        for record in records:
+            if count:
+                f.write(',\n')
+            f.write(json.dumps(record))
+            count += 1
+        f.write('\n]}\n')
+    return count
+
+
+def generate(directory, scale, seed=0):
+    """
+    Write `scale` leads and invoices, scale / 10 customers, a payment per paid
+    invoice and a chart of accounts into directory. Returns {collection: count}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    counts = {}
+    counts['leads'] = _write(directory, 'leads', (_lead(rng, i) for i in range(1, scale + 1)))
+
+    customers = [_person(rng, i) for i in range(1, max(1, scale // 10) + 1)]
+    payments = []
+
+    def invoices():
+        for invoice_id in range(1, scale + 1):
+            customer = rng.choice(customers)
+            invoice = _invoice(rng, invoice_id, customer['id'], customer)
+            if invoice['status'] == 'paid':
+                payments.append({
+                    'id': len(payments) + 1, 'invoice_id': invoice_id,
+                    'invoice_number': invoice['number'], 'customer': invoice['customer'],
+                    'date': invoice['dueDate'], 'amount': invoice['total'],
+                    'method': 'bank_transfer', 'reference': '',
+                })
+            yield invoice
+
+    counts['invoices'] = _write(directory, 'invoices', invoices())
+    counts['customers'] = _write(directory, 'customers', customers)
+    counts['payments'] = _write(directory, 'payments', payments)
+    counts['accounts'] = _write(directory, 'accounts', (
+        {
+            'id': i, 'accountCode': str(1000 + i * 10), 'accountName': f"Account {i}",
+            'accountType': ACCOUNT_TYPES[i % len(ACCOUNT_TYPES)], 'description': '',
+            'vatApplicable': 'Yes' if i % 3 == 0 else 'No',
+        }
+        for i in range(1, ACCOUNTS + 1)
+    ))
+    return counts
+
+
+def _csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(rows[0].keys())
+    for row in rows:
+        writer.writerow(row.values())
+    return out.getvalue()
+
+
+def _new_lead(i):
+    return {'name': f"Bench Lead {i}", 'company': f"Bench Co {i}", 'status': 'new', 'addedDate': '2025-12-01'}
+
+
+def _new_customer(i):
+    return {'name': f"Bench Customer {i}", 'company': f"Bench Co {i}", 'addedDate': '2025-12-01'}
+
+
+def _new_invoice(i, ctx):
+    return {
+        'customer_id': i % ctx['customers'] + 1, 'date': '2025-12-01', 'due_date': '2025-12-31',
+        'status': 'sent', 'items': [{'description': 'Consulting', 'quantity': 1, 'price': 100, 'amount': 100}],
+        'subtotal': 100, 'vat': 5, 'total': 105,
+    }
+
+
+# (name, method, request factory, list URL of the ids a delete scenario uses)
+# A factory takes the request number and the run context and returns
+# (path, body); a dict body is sent as JSON, a str as CSV.
+SCENARIOS = [
+    ('leads_page', 'GET', lambda i, ctx: ('/api/leads/?limit=100', None), None),
+    ('leads_filtered', 'GET', lambda i, ctx: ('/api/leads/?status=won&sort=-addedDate&limit=100', None), None),
+    ('customers_page', 'GET', lambda i, ctx: ('/api/customers/?limit=100', None), None),
+    ('customer_invoices', 'GET', lambda i, ctx: (f'/api/customers/{i % ctx["customers"] + 1}/invoices/', None), None),
+    ('invoices_page', 'GET', lambda i, ctx: ('/api/invoices/?limit=100', None), None),
+    ('invoices_filtered', 'GET', lambda i, ctx: (
+        '/api/invoices/?status=paid&date_from=2025-01-01&sort=-total&limit=100', None), None),
+    ('invoice_summary', 'GET', lambda i, ctx: ('/api/invoices/summary/', None), None),
+    ('payments', 'GET', lambda i, ctx: ('/api/payments/', None), None),
+    ('chart_of_accounts', 'GET', lambda i, ctx: ('/api/chart-of-accounts/', None), None),
+    ('dashboard_metrics', 'GET', lambda i, ctx: ('/api/dashboard/metrics/', None), None),
+    ('dashboard_trends', 'GET', lambda i, ctx: ('/api/dashboard/trends/?from=2023-01&to=2025-12', None), None),
+    ('search', 'GET', lambda i, ctx: (f'/api/search/?q={COMPANY_WORDS[i % len(COMPANY_WORDS)]}', None), None),
+    ('leads_export', 'GET', lambda i, ctx: ('/api/leads/export/?status=won&added_from=2025-12-01', None), None),
+    ('customers_export', 'GET', lambda i, ctx: ('/api/customers/export/?added_from=2025-12-01', None), None),
+    ('metrics', 'GET', lambda i, ctx: ('/api/metrics/', None), None),
+
+    ('add_lead', 'POST', lambda i, ctx: ('/api/leads/add/', _new_lead(i)), None),
+    ('edit_lead', 'POST', lambda i, ctx: ('/api/edit/', {'id': i % ctx['leads'] + 1, 'status': 'contacted'}), None),
+    ('convert_lead', 'POST', lambda i, ctx: (f'/api/leads/{i % ctx["leads"] + 1}/convert/', {}), None),
+    ('bulk_leads', 'POST', lambda i, ctx: (
+        '/api/leads/bulk/', {'create': [_new_lead(f"{i}-{j}") for j in range(10)]}), None),
+    ('import_leads', 'POST', lambda i, ctx: (
+        '/api/leads/import/', _csv([_new_lead(f"{i}-{j}") for j in range(10)])), None),
+    ('add_customer', 'POST', lambda i, ctx: ('/api/customers/add/', _new_customer(i)), None),
+    ('edit_customer', 'POST', lambda i, ctx: (
+        '/api/customers/edit/', {'id': i % ctx['customers'] + 1, 'notes': f"Edited {i}"}), None),
+    ('bulk_customers', 'POST', lambda i, ctx: (
+        '/api/customers/bulk/', {'create': [_new_customer(f"{i}-{j}") for j in range(10)]}), None),
+    ('import_customers', 'POST', lambda i, ctx: (
+        '/api/customers/import/', _csv([_new_customer(f"{i}-{j}") for j in range(10)])), None),
+    ('add_invoice', 'POST', lambda i, ctx: ('/api/invoices/add/', _new_invoice(i, ctx)), None),
+    ('add_custom_invoice', 'POST', lambda i, ctx: ('/api/invoices/add-custom/', {
+        **_new_invoice(i, ctx), 'customer_id': None,
+        'custom_details': {'companyName': f"Walk-in {i}", 'contactPerson': 'Bench'},
+    }), None),
+    ('bulk_invoices', 'POST', lambda i, ctx: (
+        '/api/invoices/bulk/', {'create': [_new_invoice(i + j, ctx) for j in range(10)]}), None),
+    ('edit_invoice', 'POST', lambda i, ctx: (
+        '/api/invoices/edit/', {'id': i % ctx['invoices'] + 1, 'status': 'sent'}), None),
+    ('mark_invoice_sent', 'POST', lambda i, ctx: (f'/api/invoices/{i % ctx["invoices"] + 1}/mark-sent/', {}), None),
+    ('mark_invoice_paid', 'POST', lambda i, ctx: (f'/api/invoices/{i % ctx["invoices"] + 1}/mark-paid/', {}), None),
+    ('add_payment', 'POST', lambda i, ctx: ('/api/payments/add/', {
+        'invoice_id': i % ctx['invoices'] + 1, 'amount': 105, 'date': '2025-12-15',
+    }), None),
+    ('add_account', 'POST', lambda i, ctx: ('/api/chart-of-accounts/add/', {
+        'accountCode': str(90000 + i), 'accountName': f"Bench {i}", 'accountType': 'Expense',
+    }), None),
+    ('edit_account', 'POST', lambda i, ctx: (f'/api/chart-of-accounts/{i % ACCOUNTS + 1}/edit/', {
+        'accountCode': str(1000 + i), 'accountName': f"Edited {i}", 'accountType': 'Asset',
+    }), None),
+
+    ('delete_lead', 'DELETE', lambda i, ctx: (f'/api/leads/{ctx["ids"][i]}/delete/', None),
+     '/api/leads/?sort=-id&fields=id&limit={count}'),
+    ('delete_customer', 'DELETE', lambda i, ctx: (f'/api/customers/{ctx["ids"][i]}/delete/', None),
+     '/api/customers/?sort=-id&fields=id&limit={count}'),
+    ('delete_invoice', 'DELETE', lambda i, ctx: (f'/api/invoices/{ctx["ids"][i]}/delete/', None),
+     '/api/invoices/?sort=-id&fields=id&limit={count}'),
+    ('delete_account', 'DELETE', lambda i, ctx: (f'/api/chart-of-accounts/{ctx["ids"][i]}/delete/', None),
+     '/api/chart-of-accounts/'),
+]
+
+
+class ClientTransport:
+    """Requests through Django's test client, one client per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, body):
+        from django.test import Client
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(HTTP_HOST='localhost')
+        data, content_type = _encode(body)
+        response = client.generic(method, path, data=data or '', content_type=content_type)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, content
+
+
+class HTTPTransport:
+    """Requests over HTTP to a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body):
+        data, content_type = _encode(body)
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def _encode(body):
+    if body is None:
+        return None, None
+    if isinstance(body, str):
+        return body.encode(), 'text/csv'
+    return json.dumps(body).encode(), 'application/json'
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _delete_ids(transport, source, count):
+    status, content = transport.request('GET', source.format(count=count), None)
+    if status != 200:
+        return []
+    records = json.loads(content)
+    if isinstance(records, dict):
+        records = records['results']
+    return sorted((record['id'] for record in records), reverse=True)[:count]
+
+
+def _route(path):
+    try:
+        return resolve(urlsplit(path).path).route
+    except Resolver404:
+        return None
+
+
+def run_scenario(transport, scenario, ctx, requests, concurrency):
+    name, method, make, source = scenario
+    if source is not None:
+        ctx = dict(ctx, ids=_delete_ids(transport, source, requests + 1))
+        requests = min(requests, len(ctx['ids']) - 1)
+        if requests < 1:
+            return None
+    # The first request warms up (loads the collections) and is not counted
+    warmup = make(requests, ctx)
+    transport.request(method, *warmup)
+
+    def timed(i):
+        path, body = make(i, ctx)
+        start = time.perf_counter()
+        status, _ = transport.request(method, path, body)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    return {
+        'name': name,
+        'method': method,
+        'route': _route(warmup[0]),
+        'path': warmup[0],
+        'requests': requests,
+        'errors': sum(1 for _, status in samples if status >= 400),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'rps': round(requests / elapsed, 1) if elapsed else None,
+    }
+
+
+def uncovered_routes(results):
+    """API routes in the URLconf that no scenario requested."""
+    covered = {result['route'] for result in results}
+    return sorted(
+        str(pattern.pattern) for pattern in get_resolver().url_patterns
+        if str(pattern.pattern).startswith('api/') and str(pattern.pattern) not in covered
+    )
+
+
+def run(transport, scale, requests, concurrency, names=None, progress=None):
+    """Results of every scenario (or those named), in SCENARIOS order."""
+    ctx = {'leads': scale, 'customers': max(1, scale // 10), 'invoices': scale}
+    results = []
+    for scenario in SCENARIOS:
+        if names and scenario[0] not in names:
+            continue
+        result = run_scenario(transport, scenario, ctx, requests, concurrency)
+        if result is None:
+            continue
+        results.append(result)
+        if progress is not None:
+            progress(result)
+    return results
+
+
+def compare(previous, results):
+    """Lines comparing p95 and requests per second with a previous run's results."""
+    before = {result['name']: result for result in previous}
+    lines = []
+    for result in results:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0
+        lines.append(
+            f"{result['name']:<22} p95 {old['p95_ms']:>9.2f} -> {result['p95_ms']:>9.2f} ms ({change:+.0f}%)"
+            f"   rps {old['rps']} -> {result['rps']}"
+        )
+    return lines
@@ -0,0 +1,165 @@
+"""
+Batch create/update/delete for leads, customers and invoices.
+
+    POST /api/<collection>/bulk/
+    {"create": [{...}, ...], "update": [{"id": 1, ...}, ...], "delete": [2, 3]}
+
+The whole batch is validated first; any invalid item rejects it with 400
+and the list of per-item errors. A valid batch is applied with one
+Collection.batch() call, i.e. a single storage write, and the response
+reports every item in request order:
+
+    {"created": [record, ...],
+     "updated": [record or {"id": 1, "error": "Not found"}, ...],
+     "deleted": [{"id": 2, "deleted": true}, ...]}
+
+New invoices are numbered by the store as they are saved; a number in the
+request is ignored, as it is by the add and edit endpoints.
+"""
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import store
+from .listing import DERIVED_FIELDS
+
+# collection name -> fields of a new record and their defaults
+RECORD_FIELDS = {
+    'leads': {
+        'name': None, 'company': None, 'title': '', 'email': '', 'phone': '',
+        'address': '', 'source': '', 'status': 'new', 'addedDate': '',
+        'lastContact': '', 'industry': '', 'annualRevenue': '', 'notes': '',
+    },
+    'customers': {
+        'name': None, 'company': None, 'title': '', 'email': '', 'phone': '',
+        'address': '', 'addedDate': '', 'notes': '',
+    },
+    'invoices': {
+        'number': None, 'customer': '', 'customer_id': None, 'customer_company': '',
+        'date': None, 'dueDate': None, 'status': 'draft', 'items': [],
+        'subtotal': 0, 'vat': 0, 'total': 0,
+    },
+}
+
+# collection name -> (field, prefix) the store numbers records by as they are
+# saved; clients cannot set the field, so no two records share a number
+NUMBERED_FIELDS = {
+    'invoices': ('number', 'INV-'),
+}
+
+
+class InvalidBatch(ValueError):
+    def __init__(self, errors):
+        super().__init__("Invalid batch")
+        self.errors = errors
+
+
+def build_record(name, data):
+    """A new record for the collection from request data, with the add endpoints' defaults."""
+    numbered = NUMBERED_FIELDS.get(name, (None,))[0]
+    return {
+        field: default if field == numbered else data.get(field, default)
+        for field, default in RECORD_FIELDS[name].items()
+    }
+
+
+def insert_op(name, record):
+    """The batch operation that creates a record, numbering it if the collection is numbered."""
+    if name in NUMBERED_FIELDS:
+        return ('insert', record, NUMBERED_FIELDS[name][1])
+    return ('insert', record)
+
+
+def read_only_fields(name):
+    """Fields an update cannot change: the id, derived fields and the number."""
+    numbered = NUMBERED_FIELDS.get(name, ())[:1]
+    return {'id', *DERIVED_FIELDS.get(name, ()), *numbered}
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_batch(data):
+    """(creates, updates, deletes) of a request body, or InvalidBatch."""
+    if not isinstance(data, dict):
+        raise InvalidBatch([{'error': "Expected an object with create, update and/or delete lists"}])
+    errors = []
+    unknown = set(data) - {'create', 'update', 'delete'}
+    if unknown:
+        errors.append({'error': f"Unknown keys: {', '.join(sorted(unknown))}"})
+    sections = {}
+    for section in ('create', 'update', 'delete'):
+        items = data.get(section, [])
+        if not isinstance(items, list):
+            errors.append({'section': section, 'error': "Must be a list"})
+            items = []
+        sections[section] = items
+
+    for index, item in enumerate(sections['create']):
+        if not isinstance(item, dict):
+            errors.append({'section': 'create', 'index': index, 'error': "Must be an object"})
+    for index, item in enumerate(sections['update']):
+        if not isinstance(item, dict) or not _is_id(item.get('id')):
+            errors.append({'section': 'update', 'index': index, 'error': "Must be an object with an integer id"})
+    for index, item in enumerate(sections['delete']):
+        if not _is_id(item):
+            errors.append({'section': 'delete', 'index': index, 'error': "Must be an integer id"})
+
+    size = sum(len(items) for items in sections.values())
+    maximum = getattr(settings, 'API_MAX_BULK_SIZE', 10000)
+    if size > maximum:
+        errors.append({'error': f"A batch may hold at most {maximum} items, got {size}"})
+    if errors:
+        raise InvalidBatch(errors)
+    return sections['create'], sections['update'], sections['delete']
+
+
+def _prepare_invoices(records):
+    """Fill in new invoices' customer, as add_invoice_api does."""
+    customers = store.collection('customers')
+    for record in records:
+        if record['customer_id'] == 'custom':
+            record['customer_id'] = None
+        customer = customers.get(record['customer_id']) if record['customer_id'] else None
+        if customer and not record['customer']:
+            record['customer'] = f"{customer['company']} - {customer['name']}"
+            record['customer_company'] = customer['company']
+
+
+def bulk_response(request, collection):
+    """The response of a bulk endpoint for a store collection."""
+    name = collection.name
+    try:
+        creates, updates, deletes = parse_batch(request.data)
+    except InvalidBatch as e:
+        return Response({"error": str(e), "errors": e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    records = []
+    for item in creates:
+        record = build_record(name, item)
+        if name == 'invoices' and record['dueDate'] is None:
+            record['dueDate'] = item.get('due_date')
+        records.append(record)
+    if name == 'invoices':
+        _prepare_invoices(records)
+
+    ops = [insert_op(name, record) for record in records]
+    # Derived fields (e.g. customers' invoice totals) are never stored, and
+    # numbers are the store's to assign
+    ignored = read_only_fields(name)
+    ops += [('update', item['id'], {k: v for k, v in item.items() if k not in ignored}) for item in updates]
+    ops += [('delete', record_id) for record_id in deletes]
+    results = collection.batch(ops)
+
+    created = results[:len(creates)]
+    updated = results[len(creates):len(creates) + len(updates)]
+    deleted = results[len(creates) + len(updates):]
+    return Response({
+        'created': created,
+        'updated': [
+            record if record is not None else {'id': item['id'], 'error': "Not found"}
+            for item, record in zip(updates, updated)
+        ],
+        'deleted': [{'id': record_id, 'deleted': result} for record_id, result in zip(deletes, deleted)],
+    })
@@ -0,0 +1,47 @@
+"""
+Conditional GET for the read endpoints.
+
+@conditional('leads', ...) derives an ETag and Last-Modified from the
+storage versions of the named collections (a couple of stat() calls, or two
+indexed queries with the SQLite backend) and answers If-None-Match /
+If-Modified-Since with 304 before the view loads or renders anything. Other
+responses get both headers.
+
+A response must depend only on the named collections and the request;
+one that also depends on the current date (e.g. month-to-date figures) is
+declared with daily=True, which adds today's date to the ETag and drops
+Last-Modified.
+"""
+import hashlib
+from datetime import date
+
+from django.views.decorators.http import condition
+
+from . import store
+
+
+def _versions(request, names):
+    # condition() asks for the ETag and Last-Modified separately; stat once
+    versions = getattr(request, '_store_versions', None)
+    if versions is None:
+        versions = [store.collection(name).version() for name in names]
+        request._store_versions = versions
+    return versions
+
+
+def conditional(*names, daily=False):
+    def etag(request, *args, **kwargs):
+        tags = ':'.join(f"{name}={tag}" for name, (tag, _) in zip(names, _versions(request, names)))
+        if daily:
+            tags += f":date={date.today().isoformat()}"
+        return hashlib.md5(tags.encode(), usedforsecurity=False).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if daily:
+            return None
+        modified = [modified for _, modified in _versions(request, names)]
+        if None in modified:
+            return None
+        return max(modified)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
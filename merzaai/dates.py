@@ -0,0 +1,63 @@
+from datetime import date, datetime
+
+
+# Formats found in the JSON data ("2023-06-10" and "June 10, 2023")
+DATE_FORMATS = ('%Y-%m-%d', '%B %d, %Y')
+
+
+def parse_date(value):
+    """Parse a stored date string into a date, or None if it is not one."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def ordinal_field(field):
+    """Name of the field holding the canonical ordinal of a date field."""
+    return f'{field}Ordinal'
+
+
+def date_ordinal(value):
+    """Proleptic Gregorian ordinal of a stored date, or None if it is not one."""
+    parsed = parse_date(value)
+    return None if parsed is None else parsed.toordinal()
+
+
+def date_ordinals(record, fields):
+    """{'<field>Ordinal': ordinal} for each of the date fields the record sets."""
+    return {ordinal_field(field): date_ordinal(record[field]) for field in fields if field in record}
+
+
+def month_of(ordinal):
+    """(year, month) of a date ordinal."""
+    day = date.fromordinal(ordinal)
+    return day.year, day.month
+
+
+def months_between(start, end):
+    """(year, month) of every month from start to end, both (year, month), inclusive."""
+    first = start[0] * 12 + start[1] - 1
+    last = end[0] * 12 + end[1] - 1
+    return [(i // 12, i % 12 + 1) for i in range(first, last + 1)]
+
+
+def add_months(month, count):
+    """The (year, month) count months after month (before it when negative)."""
+    index = month[0] * 12 + month[1] - 1 + count
+    return index // 12, index % 12 + 1
+
+
+def last_months(count, today=None):
+    """(year, month) of the count months ending with today's, oldest first."""
+    today = today or date.today()
+    current = (today.year, today.month)
+    return months_between(add_months(current, 1 - count), current)
@@ -0,0 +1,154 @@
+"""
+Live change events for open dashboards, as server-sent events.
+
+    GET /api/events/?collections=invoices,leads
+
+Served under ASGI only (e.g. `uvicorn testcm.asgi:application`); a WSGI
+worker would be tied up by every open stream. merzaai.store publishes one
+event per commit, and per batch of operations caught up from another worker,
+to the process-wide `bus`. The bus encodes each event once and hands the
+same frame to every subscriber's queue, so a change costs one fan-out
+however many dashboards are open:
+
+    id: <sequence>
+    event: change
+    data: {"collection": ..., "version": ..., "changes": [{"op", "id"}],
+           "aggregates": {name: summary}}
+
+While anyone is subscribed, a watcher thread syncs the subscribed
+collections every EVENTS_POLL_INTERVAL seconds so that writes made by other
+workers are published too. A subscriber that falls EVENTS_QUEUE_SIZE events
+behind is disconnected; its EventSource reconnects and should refetch.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from . import store
+from .renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+
+def _jsonable(summary):
+    # The monthly rollup is keyed by (year, month)
+    return {
+        f"{key[0]}-{key[1]:02d}" if isinstance(key, tuple) else key: value
+        for key, value in summary.items()
+    }
+
+
+def _frame(sequence, event):
+    data = dumps({
+        **event,
+        'aggregates': {name: _jsonable(summary) for name, summary in event['aggregates'].items()},
+    })
+    return b'id: %d\nevent: change\ndata: %s\n\n' % (sequence, data)
+
+
+class Subscription:
+    def __init__(self, collections, loop, size):
+        # None means every collection
+        self.collections = collections
+        self.loop = loop
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def wants(self, name):
+        return self.collections is None or name in self.collections
+
+    def _push(self, frame):
+        """Queue a frame; runs on the subscriber's event loop."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        """The next frame; None once the subscriber has fallen too far behind."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._sequence = 0
+        self._watching = False
+
+    def subscribe(self, collections=None):
+        """Subscribe the running event loop to changes of some (or all) collections."""
+        subscription = Subscription(
+            collections, asyncio.get_running_loop(), getattr(settings, 'EVENTS_QUEUE_SIZE', 100),
+        )
+        with self._lock:
+            if not self._subscribers:
+                store.add_listener(self.publish)
+            self._subscribers.add(subscription)
+            if not self._watching:
+                self._watching = True
+                threading.Thread(target=self._watch, daemon=True).start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if not self._subscribers:
+                store.remove_listener(self.publish)
+
+    def publish(self, event):
+        """Fan a store change event out to the interested subscribers; thread-safe."""
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(event['collection'])]
+            if not subscribers:
+                return
+            self._sequence += 1
+            sequence = self._sequence
+        frame = _frame(sequence, event)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._push, frame)
+            except RuntimeError:
+                # Its event loop is closed; the stream is gone
+                self.unsubscribe(subscription)
+
+    def _watched(self):
+        with self._lock:
+            if not self._subscribers:
+                self._watching = False
+                return None
+            names = set()
+            for subscription in self._subscribers:
+                names.update(subscription.collections or store.COLLECTIONS)
+            return names
+
+    def _watch(self):
+        """Catch up with other workers' writes while anyone is subscribed."""
+        try:
+            while True:
+                time.sleep(getattr(settings, 'EVENTS_POLL_INTERVAL', 1))
+                names = self._watched()
+                if names is None:
+                    break
+                for name in names:
+                    try:
+                        # Syncing publishes whatever it replays
+                        store.collection(name).count()
+                    except FileNotFoundError:
+                        pass
+                    except Exception:
+                        logger.exception("Error syncing %s for live events", name)
+        finally:
+            connections.close_all()
+
+
+bus = EventBus()
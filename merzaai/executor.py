@@ -0,0 +1,66 @@
+"""
+Async versions of the read endpoints, for the ASGI server.
+
+Under ASGI Django runs every synchronous view on one shared thread, so a
+view that waits on the store (a stat(), or a reload after another worker
+wrote) holds up every other request. async_view() turns a view into a
+coroutine that runs it on a bounded thread pool of ASYNC_STORE_WORKERS
+threads instead, rendered there too, leaving the event loop free for the
+connections that are waiting. Collections a view reads can be brought up
+to date concurrently before it runs, each on its own pool thread.
+
+testcm/asgi.py turns on settings.ASYNC_VIEWS, which makes testcm/urls.py
+route the read endpoints to these versions; WSGI workers keep the
+synchronous views.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import store
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ASYNC_STORE_WORKERS', 8),
+                thread_name_prefix='merzaai-store',
+            )
+        return _executor
+
+
+async def run(func, *args, **kwargs):
+    """Await func(*args, **kwargs) run on the store thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(func, *args, **kwargs))
+
+
+async def sync_collections(*names):
+    """Bring the named collections up to date concurrently."""
+    await asyncio.gather(*(run(store.collection(name).count) for name in names))
+
+
+def _rendered(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    # DRF responses render lazily; encode on the pool rather than the loop
+    if not response.streaming and hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def async_view(view, preload=()):
+    """Async version of a sync view, run on the store thread pool after syncing `preload`."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if preload:
+            await sync_collections(*preload)
+        return await run(_rendered, view, request, *args, **kwargs)
+    return wrapper
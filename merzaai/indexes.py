@@ -0,0 +1,90 @@
+"""
+Secondary indexes maintained by merzaai.store alongside a collection.
+
+An index is told about every record that enters or leaves the collection
+(add/remove) and answers lookups with record ids, so queries only touch the
+records that match.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+
+class HashIndex:
+    """field value -> set of ids."""
+
+    def __init__(self, field):
+        self.field = field
+        self._ids = {}
+
+    def build(self, records):
+        self._ids = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        self._ids.setdefault(record.get(self.field), set()).add(record['id'])
+
+    def remove(self, record):
+        value = record.get(self.field)
+        ids = self._ids.get(value)
+        if ids is not None:
+            ids.discard(record['id'])
+            if not ids:
+                del self._ids[value]
+
+    def lookup(self, value):
+        return self._ids.get(value, set())
+
+    def values(self):
+        return list(self._ids)
+
+
+class SortedIndex:
+    """
+    Ids ordered by key(record[field]), or by the value itself when there is
+    no key; records whose key is None are skipped.
+    """
+
+    def __init__(self, field, key=None):
+        self.field = field
+        self.key = key
+        self._entries = []
+
+    def build(self, records):
+        entries = (self._entry(record) for record in records)
+        self._entries = sorted(entry for entry in entries if entry is not None)
+
+    def _entry(self, record):
+        value = record.get(self.field)
+        if self.key is not None:
+            value = self.key(value)
+        return None if value is None else (value, record['id'])
+
+    def add(self, record):
+        entry = self._entry(record)
+        if entry is not None:
+            insort(self._entries, entry)
+
+    def remove(self, record):
+        entry = self._entry(record)
+        if entry is None:
+            return
+        index = bisect_left(self._entries, entry)
+        if index < len(self._entries) and self._entries[index] == entry:
+            del self._entries[index]
+
+    def range(self, start=None, end=None, after=None, limit=None):
+        """
+        Ids whose key is within [start, end], in key order. `after` is a
+        (key, id) position to resume from (exclusive), as used by cursors.
+        """
+        lo = 0 if start is None else bisect_left(self._entries, (start,))
+        if after is not None:
+            lo = max(lo, bisect_right(self._entries, tuple(after)))
+        if end is None:
+            hi = len(self._entries)
+        else:
+            # (end,) sorts before every (end, id) entry, so step past them
+            hi = bisect_right(self._entries, (end, float('inf')))
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [record_id for _, record_id in self._entries[lo:hi]]
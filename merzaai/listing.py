@@ -0,0 +1,357 @@
+"""
+Filtering, sorting, cursor pagination and field projection shared by the
+list endpoints.
+
+    ?status=sent,overdue     filters listed in FILTERS for the collection;
+    ?date_from=2023-06-01    dates take either format the JSON files use
+    ?q=acme                  case-insensitive substring of SEARCH_FIELDS
+    ?sort=-total             one of SORT_FIELDS, '-' for descending
+    ?fields=id,name,status   only return these keys of each record
+    ?limit=50                page size (capped at API_MAX_PAGE_SIZE)
+    ?cursor=<next>           continue from the previous page
+    ?stream=json|ndjson      stream every match instead (see merzaai.streaming)
+
+Without limit/cursor a list endpoint keeps returning the plain array it
+always has. With them it returns {"results": [...], "next": <cursor|null>}.
+Cursors are opaque to clients; they encode the sort position of the last
+record of the page. Unfiltered pages in id order cost O(page) however deep
+into the collection they are; filters are evaluated by Collection.query(),
+which goes through the collection's indexes where it has them.
+
+Fields listed in DERIVED_FIELDS are not stored with the records but added
+when they are served, by the `derive` function the view passes in (e.g.
+customers' invoice totals). Only the records served are derived, unless the
+request filters or sorts on a derived field.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from .dates import date_ordinal, ordinal_field
+from .streaming import STREAM_FORMATS, stream_response
+
+
+def _amount(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ordinal(value):
+    # Applied to the record's canonical '<field>Ordinal', not the stored string
+    return value if isinstance(value, int) else None
+
+
+def _text(value):
+    return None if value is None else str(value).casefold()
+
+
+# collection name -> query parameter -> (record field, kind of filter)
+FILTERS = {
+    'leads': {
+        'status': ('status', 'choice'),
+        'source': ('source', 'choice'),
+        'industry': ('industry', 'choice'),
+        'added_from': ('addedDate', 'date_from'),
+        'added_to': ('addedDate', 'date_to'),
+    },
+    'customers': {
+        'added_from': ('addedDate', 'date_from'),
+        'added_to': ('addedDate', 'date_to'),
+        'min_amount': ('totalAmount', 'min'),
+        'max_amount': ('totalAmount', 'max'),
+    },
+    'invoices': {
+        'status': ('status', 'choice'),
+        'customer_id': ('customer_id', 'id'),
+        'date_from': ('date', 'date_from'),
+        'date_to': ('date', 'date_to'),
+        'due_from': ('dueDate', 'date_from'),
+        'due_to': ('dueDate', 'date_to'),
+        'min_amount': ('total', 'min'),
+        'max_amount': ('total', 'max'),
+    },
+}
+
+# collection name -> fields matched by ?q=
+SEARCH_FIELDS = {
+    'leads': ('name', 'company', 'email'),
+    'customers': ('name', 'company', 'email'),
+    'invoices': ('number', 'customer'),
+}
+
+# collection name -> sortable field -> sort key of its values; date fields
+# (_ordinal) sort by their canonical ordinal
+SORT_FIELDS = {
+    'leads': {
+        'id': _amount, 'name': _text, 'company': _text, 'status': _text,
+        'addedDate': _ordinal, 'lastContact': _ordinal,
+    },
+    'customers': {
+        'id': _amount, 'name': _text, 'company': _text, 'addedDate': _ordinal,
+        'totalAmount': _amount, 'totalInvoices': _amount,
+    },
+    'invoices': {
+        'id': _amount, 'number': _text, 'customer': _text, 'status': _text,
+        'date': _ordinal, 'dueDate': _ordinal, 'total': _amount,
+    },
+}
+
+
+# collection name -> fields added by the view's derive function
+DERIVED_FIELDS = {
+    'customers': ('totalInvoices', 'totalAmount'),
+}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidQuery("Invalid cursor")
+    if not isinstance(position, dict):
+        raise InvalidQuery("Invalid cursor")
+    return position
+
+
+def _cursor_id(position):
+    # Compared against record ids in the sorted indexes; anything else breaks bisect
+    record_id = position.get('id')
+    if not isinstance(record_id, int) or isinstance(record_id, bool):
+        raise InvalidQuery("Invalid cursor")
+    return record_id
+
+
+def parse_fields(request):
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def parse_limit(request):
+    default = getattr(settings, 'API_PAGE_SIZE', 100)
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except ValueError:
+        raise InvalidQuery("limit must be an integer")
+    if limit < 1:
+        raise InvalidQuery("limit must be positive")
+    return min(limit, maximum)
+
+
+def project(records, fields):
+    return list(iter_project(records, fields))
+
+
+def iter_project(records, fields):
+    if fields is None:
+        return iter(records)
+    return ({field: record[field] for field in fields if field in record} for record in records)
+
+
+def parse_filters(request, name):
+    """Collection.query() arguments for the filters given in the request."""
+    equals, ranges, where = {}, {}, None
+    for param, (field, kind) in FILTERS.get(name, {}).items():
+        raw = request.query_params.get(param)
+        if raw is None or raw == '':
+            continue
+        if kind == 'choice':
+            equals[field] = raw.split(',')
+        elif kind == 'id':
+            try:
+                equals[field] = [int(value) for value in raw.split(',')]
+            except ValueError:
+                raise InvalidQuery(f"{param} must be an integer")
+        elif kind in ('date_from', 'date_to'):
+            ordinal = date_ordinal(raw)
+            if ordinal is None:
+                raise InvalidQuery(f"{param} must be a date")
+            field = ordinal_field(field)
+            _, start, end = ranges.get(field, (None, None, None))
+            ranges[field] = (None, ordinal, end) if kind == 'date_from' else (None, start, ordinal)
+        else:
+            amount = _amount(raw)
+            if amount is None:
+                raise InvalidQuery(f"{param} must be a number")
+            _, low, high = ranges.get(field, (_amount, None, None))
+            ranges[field] = (_amount, amount, high) if kind == 'min' else (_amount, low, amount)
+
+    text = request.query_params.get('q', '').strip().casefold()
+    if text:
+        fields = SEARCH_FIELDS.get(name, ())
+
+        def where(record):
+            return any(text in str(record.get(field) or '').casefold() for field in fields)
+
+    return equals, ranges, where
+
+
+def parse_sort(request, name):
+    """(field, sort key, descending) for ?sort=, defaulting to id order."""
+    sort = request.query_params.get('sort') or 'id'
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    keys = SORT_FIELDS.get(name, {'id': _amount})
+    if field not in keys:
+        raise InvalidQuery(f"Cannot sort by {field}; use one of: {', '.join(keys)}")
+    key = keys[field]
+    if key is _ordinal:
+        return ordinal_field(field), key, descending
+    return field, key, descending
+
+
+def sort_position(record, value, key):
+    """A record's cursor position; value reads the sort field (see Collection.value_of())."""
+    # Records without a value sort after every record that has one
+    value = key(value(record))
+    return ([1, 0] if value is None else [0, value]), record['id']
+
+
+def parse_stream(request):
+    fmt = request.query_params.get('stream')
+    if not fmt:
+        return None
+    if fmt not in STREAM_FORMATS:
+        raise InvalidQuery(f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+    if is_paginated(request):
+        raise InvalidQuery("stream cannot be combined with limit or cursor")
+    return fmt
+
+
+def is_paginated(request):
+    return 'limit' in request.query_params or 'cursor' in request.query_params
+
+
+def _derive(records, derive):
+    return records if derive is None else derive(records)
+
+
+def _in_range(value, start, end):
+    return value is not None and (start is None or value >= start) and (end is None or value <= end)
+
+
+def _select(collection, equals, ranges, where, field, key, descending, derive=None):
+    """
+    (records, derived): the matching records in sort order, and whether they
+    were derived already because a filter or the sort needed it.
+    """
+    if not (equals or ranges or where) and field == 'id' and not descending:
+        return collection.page(), False
+    derived = DERIVED_FIELDS.get(collection.name, ()) if derive is not None else ()
+    derived_ranges = {name: ranges.pop(name) for name in list(ranges) if name in derived}
+    records = collection.query(equals, ranges, where)
+    needs_derive = bool(derived_ranges) or field in derived
+    if needs_derive:
+        records = [
+            record for record in derive(records)
+            if all(_in_range(range_key(record.get(name)), start, end)
+                   for name, (range_key, start, end) in derived_ranges.items())
+        ]
+    value = collection.value_of(field)
+    records.sort(key=lambda record: sort_position(record, value, key), reverse=descending)
+    return records, needs_derive
+
+
+def select(request, collection, derive=None):
+    """
+    Records of the collection matching the request's filters, in its sort
+    order, with their derived fields.
+    """
+    equals, ranges, where = parse_filters(request, collection.name)
+    field, key, descending = parse_sort(request, collection.name)
+    records, derived = _select(collection, equals, ranges, where, field, key, descending, derive)
+    return records if derived else _derive(records, derive)
+
+
+def _id_order_response(request, collection, fields, derive):
+    if not is_paginated(request):
+        return Response(project(_derive(collection.page(), derive), fields))
+
+    limit = parse_limit(request)
+    cursor = request.query_params.get('cursor')
+    after = _cursor_id(decode_cursor(cursor)) if cursor else None
+    # Fetch one extra record to learn whether there is a next page
+    records = collection.page(after=after, limit=limit + 1)
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor({'id': records[-1]['id']})
+    return Response({'results': project(_derive(records, derive), fields), 'next': next_cursor})
+
+
+def _decode_position(cursor, field, key, value):
+    position = decode_cursor(cursor)
+    record_id = _cursor_id(position)
+    if field == 'id':
+        return sort_position(position, value, key)
+    # As sort_position() builds it: [1, 0] for a missing value, else [0, value]
+    sort_key = position.get('key')
+    if not isinstance(sort_key, list) or len(sort_key) != 2 or sort_key[0] not in (0, 1):
+        raise InvalidQuery("Invalid cursor")
+    return sort_key, record_id
+
+
+def list_response(request, collection, derive=None):
+    """
+    The GET response of a list endpoint for a store collection; derive adds
+    the collection's DERIVED_FIELDS to a list of records.
+    """
+    try:
+        fields = parse_fields(request)
+        equals, ranges, where = parse_filters(request, collection.name)
+        field, key, descending = parse_sort(request, collection.name)
+        stream = parse_stream(request)
+        unfiltered = not (equals or ranges or where) and field == 'id' and not descending
+        if unfiltered and not stream:
+            return _id_order_response(request, collection, fields, derive)
+
+        records, derived = _select(collection, equals, ranges, where, field, key, descending, derive)
+        if derived:
+            derive = None
+        if stream:
+            return stream_response(iter_project(_derive(records, derive), fields), stream)
+        if not is_paginated(request):
+            return Response(project(_derive(records, derive), fields))
+
+        limit = parse_limit(request)
+        cursor = request.query_params.get('cursor')
+        value = collection.value_of(field)
+        if cursor:
+            after = _decode_position(cursor, field, key, value)
+            positions = [sort_position(record, value, key) for record in records]
+            try:
+                if descending:
+                    start = len(positions) - bisect_left(positions[::-1], after)
+                else:
+                    start = bisect_right(positions, after)
+            except TypeError:
+                raise InvalidQuery("Invalid cursor")
+            records = records[start:]
+        next_cursor = None
+        if len(records) > limit:
+            records = records[:limit]
+            last = records[-1]
+            position, _ = sort_position(last, value, key)
+            next_cursor = encode_cursor(
+                {'id': last['id']} if field == 'id' else {'key': position, 'id': last['id']}
+            )
+        return Response({'results': project(_derive(records, derive), fields), 'next': next_cursor})
+
+    except InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,21 @@
+"""
+Sampling for the API's routine log messages.
+
+The views log every request they handle at DEBUG or INFO; on a busy server
+that is most of the log volume. SampleFilter keeps a random `rate` fraction
+of those and every warning and error. It is installed on the 'merzaai'
+handler in settings.LOGGING with settings.LOG_SAMPLE_RATE.
+"""
+import logging
+import random
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rate=1.0, name=''):
+        super().__init__(name)
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
@@ -0,0 +1,115 @@
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from merzaai import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API endpoint against synthetic data and write p50/p95/p99 "
+        "latency and requests per second to a JSON file. In-process runs generate "
+        "the data in a scratch directory; with --url, generate it first with "
+        "--generate-only --data-dir DIR and start the server with MERZAAI_JSON_DIR=DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000, help="Leads and invoices to generate (e.g. 1000, 100000, 1000000).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--scenario', action='append', dest='scenarios', help="Only run this scenario (repeatable).")
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help="A previous --output file to compare against.")
+        parser.add_argument('--url', help="Benchmark a running server instead of the test client.")
+        parser.add_argument('--data-dir', help="Where to generate the data; a temporary directory by default.")
+        parser.add_argument('--generate-only', action='store_true')
+        parser.add_argument('--skip-generate', action='store_true', help="Use the data already in --data-dir.")
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        data_dir = options['data_dir']
+        if options['skip_generate'] and not data_dir and not options['url']:
+            raise CommandError("--skip-generate needs --data-dir")
+        if not options['url'] and not options['generate_only'] and settings.STORE_BACKEND != 'json':
+            raise CommandError("In-process runs use the JSON backend; benchmark the sqlite backend with --url")
+
+        scratch = None
+        if data_dir is None and not options['url']:
+            data_dir = scratch = tempfile.mkdtemp(prefix='merzaai-bench-')
+        try:
+            if data_dir and not options['skip_generate']:
+                counts = benchmark.generate(data_dir, scale, options['seed'])
+                self.stdout.write(f"Generated {counts} in {data_dir}")
+            if options['generate_only']:
+                return
+            self._run(options, data_dir)
+        finally:
+            if scratch is not None:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    def _run(self, options, data_dir):
+        if options['url']:
+            transport = benchmark.HTTPTransport(options['url'])
+        else:
+            # The store reads JSON_DIR on every access, so nothing real is touched
+            settings.JSON_DIR = data_dir
+            transport = benchmark.ClientTransport()
+        if options['verbosity'] < 2:
+            # Every write logs at info; that would be most of what is measured
+            logging.getLogger('merzaai').setLevel(logging.WARNING)
+            logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        def progress(result):
+            self.stdout.write(
+                f"{result['name']:<22} p50 {result['p50_ms']:>9.2f}  p95 {result['p95_ms']:>9.2f}  "
+                f"p99 {result['p99_ms']:>9.2f} ms  {result['rps']:>8} req/s  errors {result['errors']}"
+            )
+
+        results = benchmark.run(
+            transport, options['scale'], options['requests'], options['concurrency'],
+            names=options['scenarios'], progress=progress,
+        )
+        report = {
+            'meta': {
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'target': options['url'] or 'test client',
+                'backend': None if options['url'] else settings.STORE_BACKEND,
+                'commit': _commit(),
+                'python': platform.python_version(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+            },
+            'results': results,
+            'uncovered': [] if options['scenarios'] else benchmark.uncovered_routes(results),
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        if report['uncovered']:
+            self.stdout.write(self.style.WARNING(f"No scenario for: {', '.join(report['uncovered'])}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)['results']
+            for line in benchmark.compare(previous, results):
+                self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from merzaai import models
+from merzaai.storage import JsonStorage
+from merzaai.store import COLLECTIONS, DATE_FIELDS, Collection
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import the JSON collections under settings.JSON_DIR into the SQLite models. "
+        "Records already imported are updated; rows with no JSON record are kept unless --clear is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help="Delete the existing rows of each collection before importing.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for name, (filename, key, model_name) in COLLECTIONS.items():
+            model = getattr(models, model_name)
+            # Load through the store so operations still in the log are included
+            records = Collection(
+                name, JsonStorage(filename, key, name), date_fields=DATE_FIELDS.get(name, ()),
+            ).all()
+
+            if options['clear']:
+                with transaction.atomic():
+                    if model is models.Invoice:
+                        models.InvoiceItem.objects.all().delete()
+                    model.objects.all().delete()
+                    models.StoreOperation.objects.filter(collection=name).delete()
+
+            # Rows already imported are updated, so the import can be rerun
+            for start in range(0, len(records), batch_size):
+                with transaction.atomic():
+                    model.save_records(records[start:start + batch_size])
+
+            self.stdout.write(f"Imported {len(records)} {name} from {filename}")
+
+        self.stdout.write(self.style.SUCCESS(
+            "Import finished. Set STORE_BACKEND = 'sqlite' to serve the API from the database."
+        ))
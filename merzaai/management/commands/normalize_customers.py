@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from merzaai import store
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop the invoice copies and totals stored on customers; they are derived from the "
+        "invoices now. Unlinked invoices a customer listed are linked to it by number first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        customers = store.collection('customers')
+        invoices = store.collection('invoices')
+        unlinked = {
+            invoice['number']: invoice['id']
+            for invoice in invoices.all() if invoice.get('customer_id') is None and invoice.get('number')
+        }
+
+        links, replacements = [], []
+        for customer in customers.all():
+            if not any(field in customer for field in store.LEGACY_CUSTOMER_FIELDS):
+                continue
+            # e.g. customers saved from a custom invoice, which kept no customer_id
+            for copy in customer.get('invoices') or []:
+                invoice_id = unlinked.pop(copy.get('number'), None)
+                if invoice_id is not None:
+                    links.append(('update', invoice_id, {'customer_id': customer['id']}))
+            # Inserting over an existing id replaces the whole record
+            replacements.append(('insert', {
+                field: value for field, value in customer.items() if field not in store.LEGACY_CUSTOMER_FIELDS
+            }))
+
+        for collection, ops in ((invoices, links), (customers, replacements)):
+            for start in range(0, len(ops), batch_size):
+                collection.batch(ops[start:start + batch_size])
+            collection.compact()
+        self.stdout.write(self.style.SUCCESS(
+            f"Normalized {len(replacements)} customers and linked {len(links)} invoices."
+        ))
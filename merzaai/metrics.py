@@ -0,0 +1,112 @@
+"""
+Request, JSON and storage metrics, exposed in the Prometheus text format.
+
+    GET /api/metrics/
+
+MetricsMiddleware (see merzaai.middleware) counts requests and times them
+per view; merzaai.renderers times JSON encoding and decoding per view and
+counts the bytes; merzaai.storage times loading, writing and compacting each
+collection and counts the bytes it reads and writes. Values are kept per
+process: under gunicorn every worker exposes its own, and Prometheus tells
+them apart by instance.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# metric name -> (type, help)
+METRICS = {
+    'merzaai_http_requests_total': ('counter', "Requests by view, method and status code."),
+    'merzaai_http_request_duration_seconds': ('histogram', "Time to produce a response, by view."),
+    'merzaai_json_dump_seconds': ('histogram', "Time to encode a JSON response, by view."),
+    'merzaai_json_dump_bytes_total': ('counter', "Bytes of JSON responses, by view."),
+    'merzaai_json_load_seconds': ('histogram', "Time to decode a JSON request body, by view."),
+    'merzaai_json_load_bytes_total': ('counter', "Bytes of JSON request bodies, by view."),
+    'merzaai_store_load_seconds': ('histogram', "Time to load a collection from its storage."),
+    'merzaai_store_write_seconds': ('histogram', "Time to persist a group of store operations."),
+    'merzaai_store_compact_seconds': ('histogram', "Time to compact a collection's storage."),
+    'merzaai_store_read_bytes_total': ('counter', "Bytes of JSON storage read, by collection."),
+    'merzaai_store_written_bytes_total': ('counter', "Bytes of JSON storage written, by collection."),
+}
+
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+# (name, labels) -> [count per bucket..., count above the last bucket, sum]
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe how long the block takes into a histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(histogram) for key, histogram in _histograms.items()}
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+            count = cumulative + histogram[len(BUCKETS)]
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(histogram[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,216 @@
+"""
+Response compression negotiated from Accept-Encoding, and request metrics.
+
+Like django.middleware.gzip.GZipMiddleware, but with brotli ('br') preferred
+when the brotli package is installed, and a configurable COMPRESS_MIN_SIZE
+instead of a fixed 200 bytes, since small JSON bodies are not worth the
+CPU. Streamed responses are compressed chunk by chunk as they are sent.
+
+MetricsMiddleware counts and times every request per view for
+merzaai.metrics. For streamed responses the time is up to the first byte.
+
+ProfilingMiddleware runs a request under cProfile when PROFILING_ENABLED is
+set and the request asks for it with ?profile=1 or an X-Profile header.
+The profile is written to PROFILING_DIR as <time>-<view>-<ms>ms.prof, for
+pstats or snakeview, and the newest PROFILING_KEEP files are kept. Disabled,
+the middleware removes itself from the chain at startup.
+
+Compression and metrics work in both sync and async mode, so under ASGI a
+request to an async view never leaves the event loop for them. Profiling is
+sync only; while enabled, Django adapts the chain around it.
+"""
+import cProfile
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Codings listed in an Accept-Encoding header with a non-zero q-value."""
+    codings = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            codings.add(coding.strip().lower())
+    return codings
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor()
+    for chunk in sequence:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def _acall(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.streaming:
+            # Async streams (server-sent events) must reach the client unbuffered
+            if response.is_async:
+                return response
+        elif len(response.content) < getattr(settings, 'COMPRESS_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            coding = 'br'
+        elif 'gzip' in accepted:
+            coding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            if coding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if coding == 'br':
+                compressed = brotli.compress(response.content)
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # The body is no longer byte-for-byte what a strong ETag promised
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
+
+
+def view_name(request):
+    """Name of the view function that handled the request, 'unmatched' if none did."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # api_view() views are classes named after the function they wrap
+    return getattr(match.func, 'view_class', match.func).__name__
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, start)
+        return response
+
+    async def _acall(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, start)
+        return response
+
+    def _record(self, request, response, start):
+        view = view_name(request)
+        metrics.observe('merzaai_http_request_duration_seconds', time.perf_counter() - start, view=view)
+        metrics.increment(
+            'merzaai_http_requests_total',
+            view=view, method=request.method, status=response.status_code,
+        )
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # One profile at a time: profilers of concurrent requests would
+        # record each other's threads (and Python 3.12 refuses two)
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        requested = request.GET.get('profile') or request.META.get('HTTP_X_PROFILE')
+        if not requested or not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            response = profiler.runcall(self.get_response, request)
+            elapsed = time.perf_counter() - start
+            response['X-Profile-File'] = self._save(profiler, view_name(request), elapsed)
+        finally:
+            self._lock.release()
+        return response
+
+    def _save(self, profiler, view, elapsed):
+        directory = getattr(settings, 'PROFILING_DIR', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%dT%H%M%S')}-{view}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(directory, filename))
+        self._rotate(directory)
+        return filename
+
+    def _rotate(self, directory):
+        keep = getattr(settings, 'PROFILING_KEEP', 50)
+        profiles = []
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.prof'):
+                continue
+            try:
+                profiles.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # Another worker rotated it away since the scan
+                continue
+        profiles.sort()
+        for _, path in profiles[:max(0, len(profiles) - keep)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another worker rotated it first
+                pass
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Account',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(default=dict)),
+                ('account_code', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('account_name', models.CharField(blank=True, max_length=255)),
+                ('account_type', models.CharField(blank=True, db_index=True, max_length=50)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(default=dict)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('company', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('email', models.CharField(blank=True, max_length=255)),
+                ('added_date', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Lead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(default=dict)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('company', models.CharField(blank=True, max_length=255)),
+                ('email', models.CharField(blank=True, max_length=255)),
+                ('source', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('added_date', models.DateField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(default=dict)),
+                ('number', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('status', models.CharField(blank=True, max_length=50)),
+                ('date', models.DateField(blank=True, db_index=True, null=True)),
+                ('due_date', models.DateField(blank=True, db_index=True, null=True)),
+                ('total', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('customer', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='invoice_rows', to='merzaai.customer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InvoiceItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('description', models.TextField(blank=True)),
+                ('quantity', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_rows', to='merzaai.invoice')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField(default=dict)),
+                ('date', models.DateField(blank=True, db_index=True, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('method', models.CharField(blank=True, max_length=50)),
+                ('invoice', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='payment_rows', to='merzaai.invoice')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='StoreOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=50)),
+                ('seq', models.BigIntegerField()),
+                ('op', models.JSONField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('collection', 'seq'), name='unique_store_operation_seq')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='merzaai_inv_status_58650b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['customer', 'status'], name='merzaai_inv_custome_bc6fe7_idx'),
+        ),
+    ]
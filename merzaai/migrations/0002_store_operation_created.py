@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merzaai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storeoperation',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
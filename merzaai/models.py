@@ -1,3 +1,247 @@
+from decimal import Decimal, InvalidOperation
+
 from django.db import models
+from django.utils import timezone
+
+from .dates import parse_date
+
+
+# Rows per bulk query, well below SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(float(value or 0))).quantize(Decimal('0.01'))
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+
+
+def _int(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+class RecordModel(models.Model):
+    """
+    A row holding one API record. The whole record is kept in `data` so
+    responses keep exactly the shape the JSON files had; the typed columns
+    are copies of the fields the views filter on, kept for indexing.
+    """
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        abstract = True
+
+    def to_record(self):
+        return {'id': self.pk, **self.data}
+
+    @classmethod
+    def from_record(cls, record):
+        obj = cls(pk=record['id'], data={k: v for k, v in record.items() if k != 'id'})
+        obj.project(record)
+        return obj
+
+    def project(self, record):
+        """Copy the indexed fields out of the record."""
+
+    @classmethod
+    def save_record(cls, record):
+        obj = cls.from_record(record)
+        obj.save()
+        return obj
+
+    @classmethod
+    def save_records(cls, records):
+        """save_record() for many records; the new ones are inserted with bulk_create()."""
+        ids = [record['id'] for record in records]
+        existing = set()
+        for start in range(0, len(ids), BATCH_SIZE):
+            existing.update(
+                cls.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).values_list('pk', flat=True)
+            )
+        created = cls.objects.bulk_create(
+            [cls.from_record(record) for record in records if record['id'] not in existing],
+            batch_size=BATCH_SIZE,
+        )
+        for record in records:
+            if record['id'] in existing:
+                cls.save_record(record)
+        return created
+
+    @classmethod
+    def record_queryset(cls):
+        return cls.objects.order_by('pk')
+
+
+class Lead(RecordModel):
+    name = models.CharField(max_length=255, blank=True)
+    company = models.CharField(max_length=255, blank=True)
+    email = models.CharField(max_length=255, blank=True)
+    source = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=50, blank=True, db_index=True)
+    added_date = models.DateField(null=True, blank=True, db_index=True)
+
+    def project(self, record):
+        self.name = _text(record.get('name'))
+        self.company = _text(record.get('company'))
+        self.email = _text(record.get('email'))
+        self.source = _text(record.get('source'))
+        self.status = _text(record.get('status'))
+        self.added_date = parse_date(record.get('addedDate'))
+
+
+class Customer(RecordModel):
+    name = models.CharField(max_length=255, blank=True)
+    company = models.CharField(max_length=255, blank=True, db_index=True)
+    email = models.CharField(max_length=255, blank=True)
+    added_date = models.DateField(null=True, blank=True)
+
+    def project(self, record):
+        self.name = _text(record.get('name'))
+        self.company = _text(record.get('company'))
+        self.email = _text(record.get('email'))
+        self.added_date = parse_date(record.get('addedDate'))
+
+
+class Invoice(RecordModel):
+    number = models.CharField(max_length=50, blank=True, db_index=True)
+    # Invoices may outlive their customer, so no database constraint
+    customer = models.ForeignKey(
+        Customer, null=True, blank=True, on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name='invoice_rows',
+    )
+    status = models.CharField(max_length=50, blank=True)
+    date = models.DateField(null=True, blank=True, db_index=True)
+    due_date = models.DateField(null=True, blank=True, db_index=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'due_date']),
+            models.Index(fields=['customer', 'status']),
+        ]
+
+    def to_record(self):
+        record = super().to_record()
+        # Line items live in InvoiceItem; 'items' in data only keeps its position
+        if 'items' in record:
+            record['items'] = [item.data for item in self.item_rows.all()]
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        obj = super().from_record(record)
+        if 'items' in obj.data:
+            obj.data['items'] = None
+        return obj
+
+    def project(self, record):
+        self.number = _text(record.get('number'))
+        self.customer_id = _int(record.get('customer_id'))
+        self.status = _text(record.get('status'))
+        self.date = parse_date(record.get('date'))
+        self.due_date = parse_date(record.get('dueDate'))
+        self.total = _decimal(record.get('total'))
+
+    @classmethod
+    def save_record(cls, record):
+        obj = super().save_record(record)
+        obj.item_rows.all().delete()
+        InvoiceItem.objects.bulk_create(InvoiceItem.from_records(obj, record.get('items') or []))
+        return obj
+
+    @classmethod
+    def save_records(cls, records):
+        created = super().save_records(records)
+        items = {record['id']: record.get('items') or [] for record in records}
+        InvoiceItem.objects.bulk_create(
+            [item for obj in created for item in InvoiceItem.from_records(obj, items[obj.pk])],
+            batch_size=BATCH_SIZE,
+        )
+        return created
+
+    @classmethod
+    def record_queryset(cls):
+        return super().record_queryset().prefetch_related('item_rows')
+
+
+class InvoiceItem(models.Model):
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='item_rows')
+    position = models.PositiveIntegerField()
+    description = models.TextField(blank=True)
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    price = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['position']
+
+    @classmethod
+    def from_records(cls, invoice, items):
+        return [
+            cls(
+                invoice=invoice,
+                position=position,
+                description=_text(item.get('description')),
+                quantity=_decimal(item.get('quantity')),
+                price=_decimal(item.get('price')),
+                amount=_decimal(item.get('amount')),
+                data=item,
+            )
+            for position, item in enumerate(items)
+            if isinstance(item, dict)
+        ]
+
+
+class Payment(RecordModel):
+    invoice = models.ForeignKey(
+        Invoice, null=True, blank=True, on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name='payment_rows',
+    )
+    date = models.DateField(null=True, blank=True, db_index=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    method = models.CharField(max_length=50, blank=True)
+
+    def project(self, record):
+        self.invoice_id = _int(record.get('invoice_id'))
+        self.date = parse_date(record.get('date'))
+        self.amount = _decimal(record.get('amount'))
+        self.method = _text(record.get('method'))
+
+
+class Account(RecordModel):
+    account_code = models.CharField(max_length=50, blank=True, db_index=True)
+    account_name = models.CharField(max_length=255, blank=True)
+    account_type = models.CharField(max_length=50, blank=True, db_index=True)
+
+    def project(self, record):
+        self.account_code = _text(record.get('accountCode'))
+        self.account_name = _text(record.get('accountName'))
+        self.account_type = _text(record.get('accountType'))
+
+
+class StoreOperation(models.Model):
+    """One insert/update/delete applied to a collection, for ModelStorage.sync()."""
+    collection = models.CharField(max_length=50)
+    seq = models.BigIntegerField()
+    op = models.JSONField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['collection', 'seq'], name='unique_store_operation_seq'),
+        ]
+
 
-# Create your models here.
+class Sequence(models.Model):
+    """
+    The next unreserved value of a sequence: a collection's ids ('invoices'),
+    or its numbers under a prefix ('invoices:INV-'); see ModelStorage.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next = models.BigIntegerField()
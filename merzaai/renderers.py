@@ -0,0 +1,96 @@
+"""
+DRF renderer and parser backed by orjson, which encodes and decodes several
+times faster than the stdlib json module. Without orjson installed they
+behave exactly like DRF's JSONRenderer and JSONParser. Enabled project-wide
+through REST_FRAMEWORK in settings. Both record their time and bytes per
+view in merzaai.metrics.
+"""
+import json
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # stdlib json only
+    orjson = None
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Types orjson does not handle itself (Decimal, datetime, ...) are
+    # encoded the way DRF encodes them
+    return _drf_encoder.default(obj)
+
+
+def dumps(data):
+    """Compact UTF-8 JSON, the same bytes DRF's JSONRenderer produces."""
+    if orjson is None:
+        ret = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+        ret = ret.encode()
+    else:
+        ret = orjson.dumps(
+            data, default=_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    # U+2028 and U+2029 are valid JSON but break JavaScript string literals
+    if b'\xe2\x80' in ret:
+        ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+    return ret
+
+
+def _view(context):
+    view = (context or {}).get('view')
+    return 'unknown' if view is None else type(view).__name__
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        start = time.perf_counter()
+        # Indented output (e.g. the browsable API) is left to DRF
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            ret = super().render(data, accepted_media_type, renderer_context)
+        else:
+            ret = dumps(data)
+        view = _view(renderer_context)
+        metrics.observe('merzaai_json_dump_seconds', time.perf_counter() - start, view=view)
+        metrics.increment('merzaai_json_dump_bytes_total', len(ret), view=view)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        view = _view(parser_context)
+        with metrics.timed('merzaai_json_load_seconds', view=view):
+            data = self._parse(stream, media_type, parser_context)
+        request = (parser_context or {}).get('request')
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (AttributeError, ValueError):
+            size = 0
+        metrics.increment('merzaai_json_load_bytes_total', size, view=view)
+        return data
+
+    def _parse(self, stream, media_type, parser_context):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
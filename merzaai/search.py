@@ -0,0 +1,150 @@
+"""
+Full-text search over store collections.
+
+TextIndex is an inverted index (word -> {record id: weight}) kept by
+merzaai.store like the other indexes, so every insert, update and delete
+re-indexes only the record it touches. Words are lower-cased runs of
+letters and digits; each query word of PREFIX_MIN_LENGTH or more matches
+every indexed word it is a prefix of, found by bisecting the sorted
+vocabulary. A record must match every query word. It is ranked by the sum,
+over query words, of its best matching word's weight: field weight x
+occurrences x inverse document frequency, halved for prefix-only matches.
+"""
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from operator import itemgetter
+
+WORD = re.compile(r'\w+')
+# Shorter query words only match whole words; 'a' or 'in' as prefixes would
+# match most of the index
+PREFIX_MIN_LENGTH = 3
+
+
+def tokenize(text):
+    return WORD.findall(str(text).casefold())
+
+
+def _values(record, path):
+    """Values at a dotted path; 'items.description' reaches into a list of dicts."""
+    values = [record]
+    for part in path.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, list):
+                found.extend(item.get(part) for item in value if isinstance(item, dict))
+            elif isinstance(value, dict):
+                found.append(value.get(part))
+        values = found
+    return [value for value in values if value not in (None, '')]
+
+
+class TextIndex:
+    """Inverted index over the text of weighted fields ({path: weight})."""
+
+    field = 'text'
+
+    def __init__(self, weights):
+        self.weights = weights
+        self._postings = {}
+        self._terms = []
+        self._documents = 0
+
+    def _words(self, record):
+        words = {}
+        for path, weight in self.weights.items():
+            for value in _values(record, path):
+                for word in tokenize(value):
+                    words[word] = words.get(word, 0) + weight
+        return words
+
+    def build(self, records):
+        self._postings = {}
+        self._documents = 0
+        for record in records:
+            self._documents += 1
+            for word, weight in self._words(record).items():
+                self._postings.setdefault(word, {})[record['id']] = weight
+        self._terms = sorted(self._postings)
+
+    def add(self, record):
+        self._documents += 1
+        for word, weight in self._words(record).items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                insort(self._terms, word)
+            postings[record['id']] = weight
+
+    def remove(self, record):
+        self._documents -= 1
+        for word in self._words(record):
+            postings = self._postings.get(word)
+            if postings is None:
+                continue
+            postings.pop(record['id'], None)
+            if not postings:
+                del self._postings[word]
+                del self._terms[bisect_left(self._terms, word)]
+
+    def _matches(self, word):
+        """Indexed words the query word matches: itself, and longer ones if it is a prefix."""
+        if len(word) < PREFIX_MIN_LENGTH:
+            return [word] if word in self._postings else []
+        start = bisect_left(self._terms, word)
+        end = bisect_left(self._terms, word + '\uffff', start)
+        return self._terms[start:end]
+
+    def search(self, text, limit=None):
+        """[(id, score)] of the records matching every word of text, best first."""
+        words = [(word, self._matches(word)) for word in dict.fromkeys(tokenize(text))]
+        if not words:
+            return []
+        # Rarest words first, so the later ones only score surviving ids
+        words.sort(key=lambda entry: sum(len(self._postings[term]) for term in entry[1]))
+        if len(words) == 1 and len(words[0][1]) == 1 and limit is not None:
+            # One indexed word: its idf is common to all matches, so the
+            # heaviest postings win without scoring the others
+            word, (term,) = words[0]
+            postings = self._postings[term]
+            idf = math.log(1 + self._documents / len(postings)) / (1 if term == word else 2)
+            top = heapq.nlargest(limit, postings.items(), key=itemgetter(1))
+            return sorted(((record_id, weight * idf) for record_id, weight in top), key=_rank)
+        scores = None
+        for word, terms in words:
+            best = {}
+            for term in terms:
+                postings = self._postings[term]
+                idf = math.log(1 + self._documents / len(postings))
+                if term != word:
+                    idf /= 2
+                if scores is None and not best:
+                    best = {record_id: weight * idf for record_id, weight in postings.items()}
+                    continue
+                if scores is None:
+                    candidates = postings.items()
+                elif len(scores) < len(postings):
+                    candidates = ((i, postings[i]) for i in scores if i in postings)
+                else:
+                    candidates = ((i, w) for i, w in postings.items() if i in scores)
+                for record_id, weight in candidates:
+                    score = weight * idf
+                    if score > best.get(record_id, 0):
+                        best[record_id] = score
+            if scores is None:
+                scores = best
+            else:
+                scores = {record_id: scores[record_id] + score for record_id, score in best.items()}
+            if not scores:
+                return []
+        if limit is not None and limit < len(scores):
+            scores = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        else:
+            scores = scores.items()
+        return sorted(scores, key=_rank)
+
+
+def _rank(item):
+    record_id, score = item
+    return -score, record_id
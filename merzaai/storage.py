@@ -0,0 +1,586 @@
+"""
+Persistence backends for merzaai.store.
+
+A storage keeps one collection durable and tells the in-memory Collection
+what changed since it last looked:
+
+    sync(collection, create=False)  bring the collection up to date, either
+                                    with collection._reset(records) or by
+                                    replaying collection._replay(op)
+    lock()                          cross-process writer lock
+    write(entries)                  persist applied (op, result) pairs
+    version()                       (tag, last modified datetime or None) of
+                                    what is stored, without loading it
+    needs_compaction()              whether compact() is worth running
+    compact(collection)             fold history into the base copy
+    invalidate()                    force a full reload on the next sync
+    write_together(writes)          (static) persist [(storage, entries)] of
+                                    several collections in one durable step
+    needs_recovery()                whether recover() has anything to redo
+    recover(collection)             finish this collection's part of
+                                    multi-collection writes a crash interrupted
+    reserve_ids(count, floor)       persist a block of count unused ids, the
+                                    first no lower than floor, and return that
+                                    first id; called with lock() held
+    reserve_number(prefix, floor)   likewise one number under a prefix, e.g.
+                                    of an invoice, never handed out again
+
+JsonStorage is the JSON snapshot + append-only log under settings.JSON_DIR;
+its multi-collection writes go through the shared Journal there.
+ModelStorage keeps records in the SQLite models from merzaai.models and
+records every operation in StoreOperation so other workers can catch up;
+its multi-collection writes are one database transaction.
+settings.STORE_BACKEND picks between them ('json' or 'sqlite').
+
+Both time their loads, writes and compactions in merzaai.metrics, labelled
+with the collection name; JsonStorage also counts the bytes it reads and
+writes.
+"""
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# The JSON backend's journal of multi-collection writes, in JSON_DIR
+JOURNAL_FILENAME = 'store.journal'
+
+# Read once: os.umask() can only be read by setting it, which would race
+# with other threads creating files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class JsonStorage:
+    """
+    A JSON snapshot ("leads.json") plus an append-only log of operations
+    ("leads.json.log", one JSON object per line). Loading replays the log
+    over the snapshot, so a mutation only appends its own record. Replaying
+    an operation that is already in the snapshot is harmless, which keeps
+    compaction crash-safe.
+    """
+
+    def __init__(self, filename, key, name=None):
+        self.filename = filename
+        self.key = key
+        self.name = name or key
+        self._document = None
+        self._signature = None
+        self._log_signature = None
+        self._log_offset = 0
+
+    @property
+    def path(self):
+        return os.path.join(settings.JSON_DIR, self.filename)
+
+    @property
+    def log_path(self):
+        return self.path + '.log'
+
+    @property
+    def sequence_path(self):
+        return self.path + '.seq'
+
+    def _stat(self):
+        path = self.path
+        st = os.stat(path)
+        return (path, st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _stat_log(self):
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def lock(self):
+        return file_lock(self.path + '.lock')
+
+    def invalidate(self):
+        self._document = None
+
+    def sync(self, collection, create=False):
+        try:
+            self._sync(collection)
+        except FileNotFoundError:
+            if not create:
+                raise
+            _atomic_write_json(self.path, {self.key: []})
+            self._sync(collection)
+
+    def _sync(self, collection):
+        if self._document is None or self._stat() != self._signature:
+            self._load(collection)
+            return
+        log_ino, log_size = self._stat_log()
+        if log_ino != self._log_signature or log_size < self._log_offset:
+            self._load(collection)
+        elif log_size > self._log_offset:
+            self._read_log(collection)
+
+    def _load(self, collection):
+        with metrics.timed('merzaai_store_load_seconds', collection=self.name):
+            signature = self._stat()
+            with open(signature[0], 'r') as f:
+                document = json.load(f)
+            metrics.increment('merzaai_store_read_bytes_total', signature[3], collection=self.name)
+            collection._reset(document.pop(self.key, []))
+            self._document = document
+            self._signature = signature
+            self._log_signature = None
+            self._log_offset = 0
+            self._read_log(collection)
+
+    def _read_log(self, collection):
+        """Replay complete log lines written since the last read."""
+        log_ino, log_size = self._stat_log()
+        if log_ino is None or log_size <= self._log_offset:
+            self._log_signature = log_ino
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            chunk = f.read(log_size - self._log_offset)
+        metrics.increment('merzaai_store_read_bytes_total', len(chunk), collection=self.name)
+        # A trailing line without a newline is still being written (or was
+        # torn by a crash); leave it for the next read.
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            if line.strip():
+                collection._replay(op_from_log(json.loads(line)))
+        self._log_signature = log_ino
+        self._log_offset += len(complete)
+
+    def write(self, entries):
+        self._append(entries, fsync=True)
+
+    def _append(self, entries, fsync):
+        with metrics.timed('merzaai_store_write_seconds', collection=self.name):
+            data = ''.join(json.dumps(op_to_log(op)) + '\n' for op, _ in entries).encode()
+            with open(self.log_path, 'ab') as f:
+                # Drop a torn line left behind by a crashed writer; we hold the
+                # file lock, so nobody else is appending right now.
+                if f.tell() > self._log_offset:
+                    f.truncate(self._log_offset)
+                    f.seek(self._log_offset)
+                f.write(data)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+        metrics.increment('merzaai_store_written_bytes_total', len(data), collection=self.name)
+        self._log_offset += len(data)
+        self._log_signature = self._stat_log()[0]
+
+    @staticmethod
+    def write_together(writes):
+        """
+        Persist [(storage, entries)] of several collections with one fsync:
+        the journal record is the commit point, the logs follow unsynced.
+        """
+        journal = _journal()
+        txn = journal.begin({
+            storage.name: [op_to_log(op) for op, _ in entries] for storage, entries in writes
+        })
+        for storage, entries in writes:
+            storage._append(entries, fsync=False)
+        journal.done(txn, [storage.name for storage, _ in writes])
+        journal.checkpoint()
+
+    def needs_recovery(self):
+        return bool(_journal().pending(self.name))
+
+    def recover(self, collection):
+        """Redo this collection's part of journalled writes whose writer died before finishing."""
+        journal = _journal()
+        for txn, entries in journal.pending(self.name):
+            ops = [op_from_log(entry) for entry in entries]
+            # Some of them may be in the log already; replaying them again is harmless
+            for op in ops:
+                collection._replay(op)
+            self.write([(op, None) for op in ops])
+            journal.done(txn, [self.name])
+            logger.warning("Recovered %d %s operations of interrupted write %s", len(ops), self.name, txn)
+
+    def _sequences(self):
+        # {"next": id, "numbers": {prefix: number}}, each the next one unreserved
+        try:
+            with open(self.sequence_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def reserve_ids(self, count, floor):
+        """Advance the id sequence ("leads.json.seq") past a new block; one small write per block."""
+        sequences = self._sequences()
+        start = max(sequences.get('next', floor), floor)
+        sequences['next'] = start + count
+        _atomic_write_json(self.sequence_path, sequences)
+        return start
+
+    def reserve_number(self, prefix, floor):
+        sequences = self._sequences()
+        numbers = sequences.setdefault('numbers', {})
+        number = max(numbers.get(prefix, floor), floor)
+        numbers[prefix] = number + 1
+        _atomic_write_json(self.sequence_path, sequences)
+        return number
+
+    def version(self):
+        """Identity, mtime and size of the snapshot and the log: two stat() calls."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return 'missing', None
+        try:
+            log = os.stat(self.log_path)
+        except FileNotFoundError:
+            log = None
+        tag = f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+        mtime = st.st_mtime
+        if log is not None:
+            tag += f"-{log.st_ino:x}-{log.st_size:x}"
+            mtime = max(mtime, log.st_mtime)
+        return tag, datetime.fromtimestamp(mtime, tz=timezone.utc)
+
+    def needs_compaction(self):
+        return self._log_offset >= getattr(settings, 'STORE_LOG_COMPACT_BYTES', 1024 * 1024)
+
+    def compact(self, collection):
+        """Rewrite the snapshot with the current records and truncate the log."""
+        if self._log_offset == 0:
+            return
+        with metrics.timed('merzaai_store_compact_seconds', collection=self.name):
+            document = dict(self._document)
+            document[self.key] = collection._values()
+            _atomic_write_json(self.path, document)
+            with open(self.log_path, 'wb') as f:
+                os.fsync(f.fileno())
+        del document[self.key]
+        self._document = document
+        self._signature = self._stat()
+        metrics.increment('merzaai_store_written_bytes_total', self._signature[3], collection=self.name)
+        self._log_signature = self._stat_log()[0]
+        self._log_offset = 0
+
+
+class ModelStorage:
+    """
+    Records kept as rows of a merzaai.models model. Each write also stores
+    its operations in StoreOperation with a per-collection sequence number;
+    sync() replays the ones it has not seen, or reloads everything if it
+    fell behind what compact() pruned.
+    """
+
+    def __init__(self, name, model_name):
+        self.name = name
+        self.model_name = model_name
+        self._seq = None
+        self._compacted_seq = 0
+
+    @property
+    def model(self):
+        from django.apps import apps
+        return apps.get_model('merzaai', self.model_name)
+
+    def lock(self):
+        database = str(settings.DATABASES['default']['NAME'])
+        return file_lock(f"{database}.{self.name}.lock")
+
+    def invalidate(self):
+        self._seq = None
+
+    def sync(self, collection, create=False):
+        from .models import StoreOperation
+        if self._seq is None:
+            self._load(collection)
+            return
+        ops = list(
+            StoreOperation.objects
+            .filter(collection=self.name, seq__gt=self._seq)
+            .order_by('seq')
+            .values_list('seq', 'op')
+        )
+        if ops and ops[0][0] != self._seq + 1:
+            self._load(collection)
+            return
+        for seq, op in ops:
+            collection._replay(op_from_log(op))
+            self._seq = seq
+
+    def _load(self, collection):
+        from django.db import transaction
+        from django.db.models import Max
+        from .models import StoreOperation
+        with metrics.timed('merzaai_store_load_seconds', collection=self.name):
+            with transaction.atomic():
+                seq = StoreOperation.objects.filter(collection=self.name).aggregate(seq=Max('seq'))['seq']
+                records = [obj.to_record() for obj in self.model.record_queryset()]
+            collection._reset(records)
+        self._seq = seq or 0
+        self._compacted_seq = self._seq
+
+    def write(self, entries):
+        from django.db import transaction
+        from .models import BATCH_SIZE, StoreOperation
+        model = self.model
+        # Only the last state of each record in the batch needs saving
+        final = {}
+        for op, result in entries:
+            record_id = op[1]['id'] if op[0] == 'insert' else op[1]
+            final[record_id] = None if op[0] == 'delete' else result
+        deleted = [record_id for record_id, record in final.items() if record is None]
+        saved = [record for record in final.values() if record is not None]
+        with metrics.timed('merzaai_store_write_seconds', collection=self.name), transaction.atomic():
+            for start in range(0, len(deleted), BATCH_SIZE):
+                model.objects.filter(pk__in=deleted[start:start + BATCH_SIZE]).delete()
+            if saved:
+                model.save_records(saved)
+            StoreOperation.objects.bulk_create([
+                StoreOperation(collection=self.name, seq=self._seq + i, op=op_to_log(op))
+                for i, (op, _) in enumerate(entries, 1)
+            ], batch_size=BATCH_SIZE)
+        self._seq += len(entries)
+
+    @staticmethod
+    def write_together(writes):
+        """Persist [(storage, entries)] of several collections in one database transaction."""
+        from django.db import transaction
+        with transaction.atomic():
+            for storage, entries in writes:
+                storage.write(entries)
+
+    def needs_recovery(self):
+        # A transaction either committed or left nothing behind
+        return False
+
+    def recover(self, collection):
+        pass
+
+    def _reserve(self, name, count, floor):
+        from django.db import transaction
+        from .models import Sequence
+        with transaction.atomic():
+            sequence, _ = Sequence.objects.get_or_create(name=name, defaults={'next': floor})
+            start = max(sequence.next, floor)
+            sequence.next = start + count
+            sequence.save(update_fields=['next'])
+        return start
+
+    def reserve_ids(self, count, floor):
+        return self._reserve(self.name, count, floor)
+
+    def reserve_number(self, prefix, floor):
+        return self._reserve(f"{self.name}:{prefix}", 1, floor)
+
+    def version(self):
+        """Sequence number and time of the latest operation, plus the highest id."""
+        from .models import StoreOperation
+        latest = (
+            StoreOperation.objects.filter(collection=self.name)
+            .order_by('-seq').values_list('seq', 'created').first()
+        )
+        # Rows bulk-imported by import_json have no operations; the highest id
+        # still tells those imports apart
+        max_pk = self.model.objects.order_by('-pk').values_list('pk', flat=True).first()
+        seq, created = latest or (0, None)
+        return f"{seq:x}-{max_pk or 0:x}", created
+
+    def needs_compaction(self):
+        keep = getattr(settings, 'STORE_OPERATIONS_KEEP', 10000)
+        return self._seq is not None and self._seq - self._compacted_seq >= keep
+
+    def compact(self, collection):
+        """Prune operations older than STORE_OPERATIONS_KEEP; the rows are the base copy."""
+        from .models import StoreOperation
+        keep = getattr(settings, 'STORE_OPERATIONS_KEEP', 10000)
+        with metrics.timed('merzaai_store_compact_seconds', collection=self.name):
+            StoreOperation.objects.filter(collection=self.name, seq__lte=self._seq - keep).delete()
+        self._compacted_seq = self._seq
+
+
+class Journal:
+    """
+    Journal of the JSON backend's multi-collection writes ("store.journal"
+    in JSON_DIR, one JSON object per line). A write appends
+    {"txn": id, "ops": {collection: [logged op, ...]}} and fsyncs it, which
+    is its commit point; it then appends to each collection's log without
+    an fsync and records {"done": id, "collections": [...]}. A torn last
+    line is a write that never committed and is dropped. A collection part
+    without a "done" record belongs to a writer that died, and is redone by
+    JsonStorage.recover() before the collection's next write (and at
+    startup, see store.recover()). Once nothing is pending and the journal
+    has grown past STORE_JOURNAL_CHECKPOINT_BYTES, the collection logs are
+    fsynced and the journal is emptied.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mutex = threading.Lock()
+        self._ino = None
+        self._offset = 0
+        # txn -> {collection: [logged op, ...]} whose parts are not done yet
+        self._pending = {}
+
+    def lock(self):
+        return file_lock(self.path + '.lock')
+
+    def _refresh(self):
+        """Read complete lines appended since the last look."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._ino, self._offset, self._pending = None, 0, {}
+            return
+        if st.st_ino != self._ino or st.st_size < self._offset:
+            # Emptied by a checkpoint: nothing was pending then
+            self._ino, self._offset, self._pending = st.st_ino, 0, {}
+        if st.st_size <= self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        complete = chunk[:chunk.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'done' not in entry:
+                self._pending[entry['txn']] = entry['ops']
+                continue
+            parts = self._pending.get(entry['done'], {})
+            for name in entry['collections']:
+                parts.pop(name, None)
+            if not parts:
+                self._pending.pop(entry['done'], None)
+        self._offset += len(complete)
+
+    def pending(self, name):
+        """[(txn, [logged op, ...])] of the writes whose part for collection `name` is not done."""
+        with self._mutex:
+            self._refresh()
+            return [(txn, parts[name]) for txn, parts in self._pending.items() if name in parts]
+
+    def _append(self, entry, fsync):
+        data = (json.dumps(entry) + '\n').encode()
+        with self.lock(), self._mutex:
+            self._refresh()
+            with open(self.path, 'ab') as f:
+                if f.tell() > self._offset:
+                    f.truncate(self._offset)
+                    f.seek(self._offset)
+                f.write(data)
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+
+    def begin(self, ops):
+        """Durably record {collection: [logged op, ...]} as committed; returns its id."""
+        txn = uuid.uuid4().hex
+        self._append({'txn': txn, 'ops': ops}, fsync=True)
+        return txn
+
+    def done(self, txn, names):
+        self._append({'done': txn, 'collections': list(names)}, fsync=False)
+
+    def checkpoint(self):
+        limit = getattr(settings, 'STORE_JOURNAL_CHECKPOINT_BYTES', 1024 * 1024)
+        with self.lock(), self._mutex:
+            self._refresh()
+            if self._pending or self._offset < limit:
+                return
+            # The logs were appended to without fsync; make them durable
+            # before forgetting what went into them
+            for entry in os.scandir(os.path.dirname(self.path)):
+                if entry.name.endswith('.log'):
+                    with open(entry.path, 'rb') as f:
+                        os.fsync(f.fileno())
+            with open(self.path, 'wb') as f:
+                os.fsync(f.fileno())
+            self._offset = 0
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def _journal():
+    # JSON_DIR is read on every access, like the storages' paths
+    path = os.path.join(settings.JSON_DIR, JOURNAL_FILENAME)
+    with _journals_lock:
+        if path not in _journals:
+            _journals[path] = Journal(path)
+        return _journals[path]
+
+
+def op_to_log(op):
+    if op[0] == 'insert':
+        return {'op': 'insert', 'record': op[1]}
+    if op[0] == 'update':
+        return {'op': 'update', 'id': op[1], 'changes': op[2]}
+    return {'op': 'delete', 'id': op[1]}
+
+
+def op_from_log(entry):
+    if entry['op'] == 'insert':
+        return ('insert', entry['record'])
+    if entry['op'] == 'update':
+        return ('update', entry['id'], entry['changes'])
+    return ('delete', entry['id'])
+
+
+def _file_mode(path):
+    """The permission bits of path, or those a new file would get under the umask."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def _atomic_write_json(path, document):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; keep the mode the file had
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
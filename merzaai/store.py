@@ -0,0 +1,729 @@
+"""
+Process-wide in-memory store for the CRM collections.
+
+Each collection is loaded once and kept in memory; every access asks its
+storage (see merzaai.storage) for what changed since, which is a cheap
+os.stat() or one indexed query, and only re-reads what changed (e.g.
+because another worker wrote it). Views must read and mutate leads,
+customers, invoices, payments and the chart of accounts through this module
+only.
+
+Records are kept in a dict keyed by id, so lookups, updates and deletes by
+id are O(1). New ids come from a block of STORE_ID_BLOCK_SIZE ids that
+each process reserves from a sequence kept by the storage (hi-lo), so an id
+costs no scan and no extra write, ids are never handed out twice by
+different workers, and a deleted record's id is not reused. Ids are unique
+but, with several workers, not in creation order. New invoices can also
+be numbered per prefix (e.g. "INV-0042") from a sequence the storage keeps
+for each prefix, one number at a time; see insert(). A number is never
+issued twice, even after its invoice is deleted, and is only skipped when
+the write that took it fails.
+Date fields listed in DATE_FIELDS are parsed once, when a record is written
+or loaded, into a canonical '<field>Ordinal' (see merzaai.dates) that
+indexes, filters, sorting and the dashboard compare instead of the stored
+strings. The ordinals are kept beside the records, not in them, so they are
+neither stored nor returned; value_of() reads them.
+Every collection keeps a sorted id index for page(); collections listed
+in INDEXES also keep secondary indexes (see merzaai.indexes and
+merzaai.search) that are updated with every mutation and back find(),
+range(), query() and search(), and collections listed in AGGREGATES keep
+running totals (see merzaai.aggregates) that are read in O(1) through
+aggregate().
+Records handed out by the store are shared between requests and must be
+treated as read-only; use insert/update/delete to change them.
+
+Writes are safe across gunicorn workers: a mutation takes the storage's
+inter-process lock, catches up with anything other processes wrote, then
+persists only its own operations. Mutations that arrive within
+STORE_GROUP_COMMIT_WINDOW seconds of each other are applied together and
+cost a single write, as do all the operations of one batch() call.
+History is compacted by a background thread once the storage asks for it.
+
+Changes that span collections go through unit_of_work(): it locks the
+collections involved, applies the changes as they are made, and persists
+them all in one durable step (a single journal append and fsync with the
+JSON backend, one transaction with SQLite). A write that crashes halfway is
+finished by the next writer of each collection, or by recover() at startup.
+
+Functions registered with add_listener() are called with a change event
+for every commit and for every batch of operations caught up from another
+worker (see Collection._publish); merzaai.events registers one while live
+dashboards are subscribed.
+"""
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections
+
+from .aggregates import (
+    CustomerInvoiceTotals, InvoiceTotals, LeadStats, MonthlyInvoiceRollup, NumberSequence,
+)
+from .dates import date_ordinals, ordinal_field
+from .indexes import HashIndex, SortedIndex
+from .search import TextIndex
+from .storage import JsonStorage, ModelStorage
+
+logger = logging.getLogger(__name__)
+
+
+# collection name -> (JSON file name, key of the record list inside it, model name)
+COLLECTIONS = {
+    'leads': ('leads.json', 'leads', 'Lead'),
+    'customers': ('customers.json', 'customers', 'Customer'),
+    'invoices': ('invoices.json', 'invoices', 'Invoice'),
+    'payments': ('payments.json', 'payments', 'Payment'),
+    'accounts': ('chart_of_accounts.json', 'COA', 'Account'),
+}
+
+
+def _invoice_indexes():
+    return [
+        HashIndex('status'),
+        HashIndex('customer_id'),
+        SortedIndex('dateOrdinal'),
+        SortedIndex('dueDateOrdinal'),
+        TextIndex({'number': 3, 'customer': 3, 'customer_company': 2, 'items.description': 1}),
+    ]
+
+
+# collection name -> date fields that get a canonical '<field>Ordinal' copy
+DATE_FIELDS = {
+    'leads': ('addedDate', 'lastContact'),
+    'customers': ('addedDate',),
+    'invoices': ('date', 'dueDate'),
+    'payments': ('date',),
+}
+
+# collection name -> factory for the secondary indexes kept on it
+INDEXES = {
+    'leads': lambda: [
+        HashIndex('status'),
+        SortedIndex('addedDateOrdinal'),
+        TextIndex({'name': 3, 'company': 3, 'email': 2, 'notes': 1}),
+    ],
+    'customers': lambda: [
+        SortedIndex('addedDateOrdinal'),
+        TextIndex({'name': 3, 'company': 3, 'email': 2, 'notes': 1}),
+    ],
+    'invoices': _invoice_indexes,
+}
+
+# collection name -> factory for the running aggregates kept on it
+AGGREGATES = {
+    'invoices': lambda: [
+        InvoiceTotals(), MonthlyInvoiceRollup(), CustomerInvoiceTotals(), NumberSequence('number'),
+    ],
+    'leads': lambda: [LeadStats()],
+}
+
+# Customer fields that are derived from the invoices (see
+# aggregates.CustomerInvoiceTotals) rather than stored; 'invoices' held
+# copies of them before
+LEGACY_CUSTOMER_FIELDS = ('invoices', 'totalInvoices', 'totalAmount')
+
+# Called with every change event; see Collection._publish
+_listeners = []
+
+
+def add_listener(listener):
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    try:
+        _listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+class Collection:
+    def __init__(self, name, storage, indexes=(), aggregates=(), date_fields=()):
+        self.name = name
+        self.storage = storage
+        self.date_fields = tuple(date_fields)
+        self._ordinal_fields = {ordinal_field(field) for field in self.date_fields}
+        self._indexes = {index.field: index for index in indexes}
+        # Every collection can be walked in id order, for cursor pagination
+        self._indexes.setdefault('id', SortedIndex('id'))
+        self._aggregates = {aggregate.name: aggregate for aggregate in aggregates}
+        self._lock = threading.RLock()
+        self._records = {}
+        # id -> {'<field>Ordinal': ordinal} of the record's date fields
+        self._ordinals = {}
+        # One past the highest id seen; reserved blocks start no lower
+        self._next_id = 1
+        # [next, end) of the ids this process has reserved
+        self._id_block = None
+        self._queue_lock = threading.Lock()
+        self._queue = []
+        self._committing = False
+        self._compacting = False
+        # Changes caught up from storage and not yet published
+        self._changes = []
+
+    def _ensure_loaded(self):
+        self.storage.sync(self)
+        self._publish()
+
+    def _ensure_writable(self):
+        # Only called with the storage lock held, as redoing writes needs;
+        # what it catches up is published once that lock is released
+        self.storage.sync(self, create=True)
+        self.storage.recover(self)
+
+    def _values(self):
+        return list(self._records.values())
+
+    def _reset(self, records):
+        ids = [r['id'] for r in records if isinstance(r.get('id'), int)]
+        self._next_id = max(ids, default=0) + 1
+        self._records = {}
+        self._ordinals = {}
+        for record in records:
+            # Records saved without an id get one so they can be addressed
+            if record.get('id') is None:
+                record = {'id': self._allocate_id(), **record}
+            self._set(record)
+        keyed = [self._keyed(record) for record in self._records.values()]
+        for index in self._maintained():
+            index.build(keyed)
+        if _listeners:
+            # Anything caught up before is superseded by the reload
+            self._changes = [{'op': 'reload'}]
+
+    def _set(self, record):
+        ordinals = date_ordinals(record, self.date_fields)
+        if ordinals:
+            self._ordinals[record['id']] = ordinals
+        else:
+            self._ordinals.pop(record['id'], None)
+        self._records[record['id']] = record
+
+    def _keyed(self, record):
+        """The record as indexes and aggregates see it, with its date ordinals."""
+        ordinals = self._ordinals.get(record['id'])
+        return {**record, **ordinals} if ordinals else record
+
+    def value_of(self, field):
+        """A function giving a record's value of field, a '<field>Ordinal' included."""
+        if field in self._ordinal_fields:
+            return lambda record: self._ordinals.get(record['id'], {}).get(field)
+        return lambda record: record.get(field)
+
+    def _allocate_id(self):
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+    def _new_id(self):
+        """The next id of this process's reserved block; only called with the storage lock held."""
+        while True:
+            if self._id_block is None or self._id_block[0] >= self._id_block[1]:
+                size = getattr(settings, 'STORE_ID_BLOCK_SIZE', 100)
+                start = self.storage.reserve_ids(size, self._next_id)
+                self._id_block = [start, start + size]
+            new_id = self._id_block[0]
+            self._id_block[0] += 1
+            # Records written with their own ids (e.g. imports) bypass the sequence
+            if new_id not in self._records:
+                return new_id
+
+    def _number(self, prefix):
+        """The next number under prefix; only called with the storage lock held."""
+        numbers = self._aggregates.get('numbers')
+        if numbers is None:
+            raise ValueError(f"{self.name} records are not numbered")
+        number = self.storage.reserve_number(prefix, numbers.highest(prefix) + 1)
+        return numbers.field, numbers.format(prefix, number)
+
+    def all(self):
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._records.values())
+
+    def count(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._records)
+
+    def version(self):
+        """The storage's (tag, last modified) of the stored records; nothing is loaded."""
+        return self.storage.version()
+
+    def get(self, record_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._records.get(record_id)
+
+    def last(self, n, **criteria):
+        """The n most recently added records, optionally matching find() criteria."""
+        with self._lock:
+            self._ensure_loaded()
+            if not criteria:
+                return list(islice(reversed(self._records.values()), n))[::-1]
+            ids = None
+            for field, value in criteria.items():
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                matched = set().union(*(self._indexes[field].lookup(v) for v in values))
+                ids = matched if ids is None else ids & matched
+            return [self._records[i] for i in sorted(heapq.nlargest(n, ids))]
+
+    def page(self, after=None, limit=None):
+        """Records in id order, starting after the given id, at most limit of them."""
+        with self._lock:
+            self._ensure_loaded()
+            position = None if after is None else (after, after)
+            ids = self._indexes['id'].range(after=position, limit=limit)
+            return [self._records[i] for i in ids]
+
+    def aggregate(self, name, **options):
+        """Current summary of one of the collection's running aggregates."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._aggregates[name].summary(**options)
+
+    def distinct(self, field):
+        """Values present in an indexed field."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._indexes[field].values()
+
+    def find(self, **criteria):
+        """
+        Records whose fields equal the given values, in id order. A list,
+        tuple or set matches any of its values.
+        """
+        return self.query(equals=criteria)
+
+    def query(self, equals=None, ranges=None, where=None):
+        """
+        Records matching every condition, in id order:
+
+            equals  {field: value}              a list, tuple or set matches any value
+            ranges  {field: (key, start, end)}  key(record[field]) within [start, end];
+                                                either bound may be None, and so may
+                                                key to compare the value itself
+            where   predicate called with each remaining candidate
+
+        Equality on hash-indexed fields is resolved through the index; failing
+        that, a range on a sorted-indexed field (built with the same key) is.
+        Everything else is checked on the candidates.
+        """
+        equals = {
+            field: value if isinstance(value, (list, tuple, set)) else [value]
+            for field, value in (equals or {}).items()
+        }
+        ranges = dict(ranges or {})
+        with self._lock:
+            self._ensure_loaded()
+            ids = None
+            for field in list(equals):
+                index = self._indexes.get(field)
+                if isinstance(index, HashIndex):
+                    matched = set().union(*(index.lookup(v) for v in equals.pop(field)))
+                    ids = matched if ids is None else ids & matched
+            if ids is None:
+                for field, (key, start, end) in ranges.items():
+                    index = self._indexes.get(field)
+                    if isinstance(index, SortedIndex) and index.key is key:
+                        del ranges[field]
+                        ids = set(index.range(start, end))
+                        break
+            if ids is None:
+                # Insertion order is not id order once several workers insert
+                candidates = [self._records[i] for i in self._indexes['id'].range()]
+            else:
+                candidates = [self._records[i] for i in sorted(ids)]
+            equals = [(self.value_of(field), values) for field, values in equals.items()]
+            ranges = [(self.value_of(field), key, start, end) for field, (key, start, end) in ranges.items()]
+            return [
+                record for record in candidates
+                if all(value(record) in values for value, values in equals)
+                and all(_within(_keyed(key, value(record)), start, end)
+                        for value, key, start, end in ranges)
+                and (where is None or where(record))
+            ]
+
+    def search(self, text, limit=None):
+        """[(record, score)] matching every word of text as a prefix, best first."""
+        with self._lock:
+            self._ensure_loaded()
+            return [
+                (self._records[i], score)
+                for i, score in self._indexes['text'].search(text, limit)
+            ]
+
+    def range(self, field, start=None, end=None):
+        """Records whose sorted-index key for field lies in [start, end], in key order."""
+        with self._lock:
+            self._ensure_loaded()
+            return [self._records[i] for i in self._indexes[field].range(start, end)]
+
+    def insert(self, record, number_prefix=None):
+        """
+        Append a record, assigning the next id when it has none. With
+        number_prefix the record also gets the next number under that prefix
+        in the collection's numbered field (see aggregates.NumberSequence),
+        e.g. "INV-0042".
+        """
+        return self._submit([_insert_op(record, number_prefix)])[0]
+
+    def update(self, record_id, changes):
+        """Merge changes into a record. Returns the new record or None."""
+        return self._submit([('update', record_id, dict(changes))])[0]
+
+    def delete(self, record_id):
+        """Remove a record. Returns False when it does not exist."""
+        return self._submit([('delete', record_id)])[0]
+
+    def batch(self, ops):
+        """
+        Apply ('insert', record), ('update', id, changes) and ('delete', id)
+        operations together: either all of them are persisted, in a single
+        storage write, or none are. Returns what insert/update/delete would
+        have returned for each, in order. ('insert', record, number_prefix)
+        numbers the record as insert() does.
+        """
+        copied = []
+        for op in ops:
+            if op[0] == 'insert':
+                copied.append(_insert_op(*op[1:]))
+            elif op[0] == 'update':
+                copied.append(('update', op[1], dict(op[2])))
+            elif op[0] == 'delete':
+                copied.append(('delete', op[1]))
+            else:
+                raise ValueError(f"Unknown store operation: {op[0]}")
+        if not copied:
+            return []
+        return self._submit(copied)
+
+    def compact(self):
+        """Fold the storage's operation history into its base copy."""
+        with self._lock, self.storage.lock():
+            self._ensure_writable()
+            self.storage.compact(self)
+        self._publish()
+
+    def _submit(self, ops):
+        pending = _Pending(ops)
+        with self._queue_lock:
+            self._queue.append(pending)
+            leader = not self._committing
+            self._committing = True
+
+        if leader:
+            window = getattr(settings, 'STORE_GROUP_COMMIT_WINDOW', 0)
+            if window:
+                time.sleep(window)
+            while True:
+                with self._queue_lock:
+                    batch, self._queue = self._queue, []
+                    if not batch:
+                        self._committing = False
+                        break
+                self._commit(batch)
+            self._maybe_compact()
+
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _commit(self, batch):
+        changes = []
+        try:
+            with self._lock, self.storage.lock():
+                self._ensure_writable()
+                logged = []
+                stale = False
+                for pending in batch:
+                    try:
+                        results, applied = [], []
+                        for op in pending.ops:
+                            result, op = self._apply(op)
+                            results.append(result)
+                            if op is not None:
+                                applied.append((op, result))
+                    except Exception as e:
+                        pending.error = e
+                        stale = True
+                    else:
+                        pending.result = results
+                        logged.extend(applied)
+                if logged:
+                    self.storage.write(logged)
+                    changes = [_change(op) for op, _ in logged]
+                if stale:
+                    # A failed op may have been half applied; rebuild from disk.
+                    self.storage.invalidate()
+        except Exception as e:
+            # The in-memory copy may be ahead of the disk now; reload it.
+            self.storage.invalidate()
+            for pending in batch:
+                pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+        self._publish(changes)
+
+    def _maybe_compact(self):
+        with self._queue_lock:
+            if self._compacting or not self.storage.needs_compaction():
+                return
+            self._compacting = True
+        threading.Thread(target=self._background_compact, daemon=True).start()
+
+    def _background_compact(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Error compacting %s", self.name)
+        finally:
+            self._compacting = False
+            connections.close_all()
+
+    def _replay(self, op):
+        """Apply an operation another worker committed, as caught up by the storage."""
+        _, op = self._apply(op)
+        if op is not None and _listeners:
+            self._changes.append(_change(op))
+
+    def _publish(self, changes=()):
+        """
+        Call the listeners with one event for the changes caught up from
+        storage, if any, and one for the given group of changes:
+        {collection, version, changes: [{op, id}], aggregates: {name: summary}}.
+        'reload' changes carry no id; the records were re-read from storage.
+        Never called with the storage lock held, so that building the events
+        does not hold up other workers' writes.
+        """
+        if not _listeners:
+            return
+        with self._lock:
+            replayed, self._changes = self._changes, []
+            events = [self._event(group) for group in (replayed, changes) if group]
+        for event in events:
+            for listener in list(_listeners):
+                try:
+                    listener(event)
+                except Exception:
+                    logger.exception("Error publishing %s changes", self.name)
+
+    def _event(self, changes):
+        return {
+            'collection': self.name,
+            'version': self.storage.version()[0],
+            'changes': changes,
+            'aggregates': {
+                name: aggregate.summary() for name, aggregate in self._aggregates.items()
+                if getattr(aggregate, 'in_events', True)
+            },
+        }
+
+    def _apply(self, op):
+        """
+        Apply an operation to the in-memory records.
+
+        Returns (result, op to log); the logged op is None when nothing
+        changed. Replaying a logged op over a state that already contains it
+        leaves that state unchanged.
+        """
+        if op[0] == 'insert':
+            record = op[1]
+            if len(op) > 2 and op[2] is not None:
+                field, number = self._number(op[2])
+                record = {**record, field: number}
+            if record.get('id') is None:
+                record.pop('id', None)
+                record = {'id': self._new_id(), **record}
+            elif isinstance(record['id'], int) and record['id'] >= self._next_id:
+                self._next_id = record['id'] + 1
+            current = self._records.get(record['id'])
+            current = None if current is None else self._keyed(current)
+            self._set(record)
+            self._reindex(current, self._keyed(record))
+            return record, ('insert', record)
+
+        if op[0] == 'update':
+            current = self._records.get(op[1])
+            if current is None:
+                return None, None
+            changes = op[2]
+            record = dict(current)
+            record.update(changes)
+            current = self._keyed(current)
+            if any(field in changes for field in self.date_fields):
+                self._set(record)
+            else:
+                self._records[op[1]] = record
+            self._reindex(current, self._keyed(record))
+            return record, ('update', op[1], changes)
+
+        if op[0] == 'delete':
+            current = self._records.pop(op[1], None)
+            if current is None:
+                return False, None
+            self._reindex(self._keyed(current), None)
+            self._ordinals.pop(op[1], None)
+            return True, op
+
+        raise ValueError(f"Unknown store operation: {op[0]}")
+
+    def _maintained(self):
+        return list(self._indexes.values()) + list(self._aggregates.values())
+
+    def _reindex(self, old, new):
+        for index in self._maintained():
+            if old is not None:
+                index.remove(old)
+            if new is not None:
+                index.add(new)
+
+
+class UnitOfWork:
+    """
+    Changes to several collections that are persisted together or not at
+    all; see unit_of_work(). Each change is applied as it is made and
+    returns what the Collection method would.
+    """
+
+    def __init__(self, names):
+        self._collections = [_collections[name] for name in sorted(set(names))]
+        self._entries = {c.name: [] for c in self._collections}
+        self._locks = None
+
+    def __enter__(self):
+        # Always in name order, so that units of work cannot deadlock
+        with ExitStack() as stack:
+            for c in self._collections:
+                stack.enter_context(c._lock)
+                stack.enter_context(c.storage.lock())
+                c._ensure_writable()
+            self._locks = stack.pop_all()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._commit()
+            else:
+                self._rollback()
+        finally:
+            self._locks.close()
+        for c in self._collections:
+            c._publish([_change(op) for op, _ in self._entries[c.name]] if exc_type is None else ())
+        if exc_type is None:
+            for c in self._collections:
+                c._maybe_compact()
+        return False
+
+    def insert(self, name, record, number_prefix=None):
+        return self._apply(name, _insert_op(record, number_prefix))
+
+    def update(self, name, record_id, changes):
+        return self._apply(name, ('update', record_id, dict(changes)))
+
+    def delete(self, name, record_id):
+        return self._apply(name, ('delete', record_id))
+
+    def _apply(self, name, op):
+        if name not in self._entries:
+            raise ValueError(f"{name} is not part of this unit of work")
+        result, op = _collections[name]._apply(op)
+        if op is not None:
+            self._entries[name].append((op, result))
+        return result
+
+    def _commit(self):
+        writes = [(c.storage, self._entries[c.name]) for c in self._collections if self._entries[c.name]]
+        if not writes:
+            return
+        try:
+            type(writes[0][0]).write_together(writes)
+        except Exception:
+            self._rollback()
+            raise
+
+    def _rollback(self):
+        # The changes were applied in memory only; reload what is stored.
+        # A journalled write that failed later on is redone by recovery.
+        for c in self._collections:
+            c.storage.invalidate()
+
+
+def unit_of_work(*names):
+    """
+    Persist changes to the named collections in one durable step:
+
+        with store.unit_of_work('customers', 'leads') as work:
+            customer = work.insert('customers', record)
+            work.update('leads', lead_id, {'status': 'won'})
+
+    Nothing is persisted if the block raises. Inside the block, change the
+    named collections through `work` only.
+    """
+    return UnitOfWork(names)
+
+
+def _insert_op(record, number_prefix=None):
+    if number_prefix is None:
+        return ('insert', dict(record))
+    return ('insert', dict(record), number_prefix)
+
+
+def _change(op):
+    return {'op': op[0], 'id': op[1]['id'] if op[0] == 'insert' else op[1]}
+
+
+def _keyed(key, value):
+    return value if key is None else key(value)
+
+
+def _within(value, start, end):
+    if value is None:
+        return False
+    return (start is None or value >= start) and (end is None or value <= end)
+
+
+class _Pending:
+    def __init__(self, ops):
+        self.ops = ops
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def _make_storage(name):
+    filename, key, model_name = COLLECTIONS[name]
+    if getattr(settings, 'STORE_BACKEND', 'json') == 'sqlite':
+        return ModelStorage(name, model_name)
+    return JsonStorage(filename, key, name)
+
+
+_collections = {
+    name: Collection(
+        name, _make_storage(name),
+        INDEXES.get(name, list)(),
+        AGGREGATES.get(name, list)(),
+        DATE_FIELDS.get(name, ()),
+    )
+    for name in COLLECTIONS
+}
+
+
+def collection(name):
+    return _collections[name]
+
+
+def recover():
+    """Finish the multi-collection writes that crashed workers left half done; run at startup."""
+    for c in _collections.values():
+        if c.storage.needs_recovery():
+            with c._lock, c.storage.lock():
+                c._ensure_writable()
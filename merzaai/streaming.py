@@ -0,0 +1,51 @@
+"""
+Streaming responses for large list exports.
+
+    ?stream=json     one JSON array, sent while it is being encoded
+    ?stream=ndjson   one JSON record per line (application/x-ndjson)
+
+Records are encoded API_STREAM_CHUNK_SIZE at a time, so the first bytes go
+out immediately and the response never exists as one string; the records
+themselves are the ones merzaai.store already holds.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _chunks(records):
+    size = getattr(settings, 'API_STREAM_CHUNK_SIZE', 500)
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json(records):
+    yield b'['
+    separator = b''
+    for chunk in _chunks(records):
+        yield separator + b','.join(dumps(record) for record in chunk)
+        separator = b','
+    yield b']'
+
+
+def iter_ndjson(records):
+    for chunk in _chunks(records):
+        yield b''.join(dumps(record) + b'\n' for record in chunk)
+
+
+def stream_response(records, fmt):
+    """A StreamingHttpResponse encoding an iterable of records as fmt ('json' or 'ndjson')."""
+    content = iter_json(records) if fmt == 'json' else iter_ndjson(records)
+    return StreamingHttpResponse(content, content_type=STREAM_FORMATS[fmt])
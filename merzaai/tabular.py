@@ -0,0 +1,224 @@
+"""
+CSV and XLSX import/export for leads and customers.
+
+    GET  /api/<collection>/export/?filetype=csv|xlsx&<list filters>
+    POST /api/<collection>/import/   multipart "file" (.csv or .xlsx), or a
+                                     text/csv request body
+
+Exports take the same filters, search and sort as the list endpoints (see
+merzaai.listing). CSV is streamed API_STREAM_CHUNK_SIZE rows at a time;
+XLSX is written by openpyxl's write-only mode to a spooled temporary file.
+
+Imports read the upload row by row (Django keeps large uploads on disk) and
+apply API_IMPORT_BATCH_SIZE rows per Collection.batch() call, so memory
+stays bounded by one batch whatever the file size. Rows whose id matches an
+existing record update the fields whose cells are not blank; all other rows
+are created with the add endpoints' defaults (see merzaai.bulk). XLSX needs
+openpyxl installed.
+"""
+import codecs
+import csv
+import tempfile
+from itertools import islice
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+from .bulk import RECORD_FIELDS, build_record, insert_op, read_only_fields
+from .listing import DERIVED_FIELDS, InvalidQuery, select
+
+try:
+    import openpyxl
+except ImportError:  # CSV only
+    openpyxl = None
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def columns(name):
+    """Exported columns: id and every scalar field of a new record."""
+    return ['id'] + [
+        field for field, default in RECORD_FIELDS[name].items()
+        if not isinstance(default, (list, dict))
+    ]
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _Echo:
+    """File-like object whose write() returns the text, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _iter_csv(records, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for chunk in _chunks(records, getattr(settings, 'API_STREAM_CHUNK_SIZE', 500)):
+        yield ''.join(writer.writerow([record.get(field, '') for field in fields]) for record in chunk)
+
+
+def _xlsx_file(records, fields, title):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(fields)
+    for record in records:
+        sheet.append([_xlsx_value(record.get(field)) for field in fields])
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def _xlsx_value(value):
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def export_response(request, collection, derive=None):
+    """
+    The GET response of an export endpoint for a store collection; derive
+    adds its DERIVED_FIELDS as extra columns (see merzaai.listing).
+    """
+    name = collection.name
+    filetype = request.query_params.get('filetype', 'csv')
+    try:
+        if filetype not in ('csv', 'xlsx'):
+            raise InvalidQuery("filetype must be csv or xlsx")
+        if filetype == 'xlsx' and openpyxl is None:
+            raise InvalidQuery("XLSX export needs openpyxl installed")
+        records = select(request, collection, derive)
+    except InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    fields = columns(name)
+    if derive is not None:
+        fields += DERIVED_FIELDS.get(name, ())
+    if filetype == 'xlsx':
+        return FileResponse(
+            _xlsx_file(records, fields, name), as_attachment=True,
+            filename=f'{name}.xlsx', content_type=XLSX_CONTENT_TYPE,
+        )
+    response = StreamingHttpResponse(_iter_csv(records, fields), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{name}.csv"'
+    return response
+
+
+def _csv_rows(binary):
+    # Any iterable of byte lines: an uploaded file or the request itself
+    yield from csv.reader(codecs.iterdecode(binary, 'utf-8-sig'))
+
+
+def _xlsx_rows(binary):
+    workbook = openpyxl.load_workbook(binary, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _convert(value, default):
+    """A cell as the type of the field's default: numbers stay numbers."""
+    if isinstance(value, str):
+        value = value.strip()
+    if _blank(value):
+        return default
+    if isinstance(default, (int, float)) and not isinstance(default, bool) and isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+    return value
+
+
+def _row_op(collection, name, header, row):
+    values = dict(zip(header, row))
+    record_id = values.pop('id', '')
+    if record_id not in ('', None):
+        try:
+            record_id = int(record_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid id: {record_id}")
+        if collection.get(record_id) is not None:
+            defaults = RECORD_FIELDS[name]
+            read_only = read_only_fields(name)
+            # Blank cells keep the current values; defaults are for new records
+            changes = {
+                field: _convert(value, defaults[field])
+                for field, value in values.items()
+                if field in defaults and field not in read_only and not _blank(value)
+            }
+            return ('update', record_id, changes)
+    data = {
+        field: _convert(value, default)
+        for field, default in RECORD_FIELDS[name].items()
+        for value in [values.get(field)] if value is not None
+    }
+    return insert_op(name, build_record(name, data))
+
+
+def import_rows(collection, rows):
+    """Apply spreadsheet rows (header first) in batches; returns the import summary."""
+    name = collection.name
+    rows = iter(rows)
+    header = [str(cell).strip() for cell in next(rows, [])]
+    if not header:
+        raise InvalidQuery("The file is empty")
+    created = updated = 0
+    errors = []
+    batch_size = getattr(settings, 'API_IMPORT_BATCH_SIZE', 1000)
+    # Row 1 is the header
+    numbered = enumerate(rows, 2)
+    for chunk in _chunks(numbered, batch_size):
+        ops = []
+        for line, row in chunk:
+            if not any(cell not in ('', None) for cell in row):
+                continue
+            try:
+                ops.append(_row_op(collection, name, header, row))
+            except ValueError as e:
+                errors.append({'row': line, 'error': str(e)})
+        for op in ops:
+            if op[0] == 'insert':
+                created += 1
+            else:
+                updated += 1
+        collection.batch(ops)
+    return {'created': created, 'updated': updated, 'errors': errors}
+
+
+def import_response(request, collection):
+    """The POST response of an import endpoint for a store collection."""
+    try:
+        if request.content_type.startswith('text/csv'):
+            rows = _csv_rows(request.stream or [])
+        elif 'file' in request.FILES:
+            upload = request.FILES['file']
+            if upload.name.lower().endswith('.xlsx'):
+                if openpyxl is None:
+                    raise InvalidQuery("XLSX import needs openpyxl installed")
+                rows = _xlsx_rows(upload.file)
+            else:
+                rows = _csv_rows(upload.file)
+        else:
+            raise InvalidQuery("Upload a CSV or XLSX file as 'file', or send a text/csv body")
+        return Response(import_rows(collection, rows))
+    except (InvalidQuery, UnicodeDecodeError, csv.Error) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
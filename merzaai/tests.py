@@ -1,3 +1,109 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
 
-# Create your tests here.
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from . import store
+from .storage import JOURNAL_FILENAME, Journal, op_to_log
+
+
+class StoreTestCase(TestCase):
+    """Runs against a copy of the bundled JSON data, which is left untouched."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.json_dir = os.path.join(directory, 'json')
+        shutil.copytree(settings.JSON_DIR, self.json_dir)
+        override = override_settings(JSON_DIR=self.json_dir, STORE_BACKEND='json')
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class RecoveryTests(StoreTestCase):
+    def test_recover_redoes_a_write_interrupted_after_its_journal_record(self):
+        # A unit of work whose worker died right after the commit point
+        Journal(os.path.join(self.json_dir, JOURNAL_FILENAME)).begin({
+            'customers': [op_to_log(('insert', {'id': 500, 'name': 'Ghost', 'company': 'Gone'}))],
+            'leads': [op_to_log(('update', 1, {'notes': 'recovered'}))],
+        })
+
+        store.recover()
+
+        self.assertEqual(store.collection('customers').get(500)['name'], 'Ghost')
+        self.assertEqual(store.collection('leads').get(1)['notes'], 'recovered')
+        self.assertFalse(store.collection('leads').storage.needs_recovery())
+        # Redone into the collection's log, so other workers read it too
+        fresh = store.Collection('leads', store._make_storage('leads'))
+        self.assertEqual(fresh.get(1)['notes'], 'recovered')
+
+
+class ConcurrencyTests(StoreTestCase):
+    @override_settings(STORE_ID_BLOCK_SIZE=5)
+    def test_concurrent_inserts_get_unique_ids_and_numbers(self):
+        # The store's own collection and two more standing in for other workers
+        workers = [store.collection('invoices')] + [
+            store.Collection('invoices', store._make_storage('invoices'), aggregates=store.AGGREGATES['invoices']())
+            for _ in range(2)
+        ]
+        highest = store.collection('invoices').aggregate('numbers').get('INV-', 0)
+        created = []
+
+        def insert(collection):
+            for _ in range(20):
+                created.append(collection.insert({'number': None, 'status': 'draft'}, number_prefix='INV-'))
+
+        threads = [threading.Thread(target=insert, args=(worker,)) for worker in workers for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ids = [record['id'] for record in created]
+        numbers = sorted(record['number'] for record in created)
+        self.assertEqual(len(set(ids)), 120)
+        self.assertEqual(numbers, [f'INV-{n:04d}' for n in range(highest + 1, highest + 121)])
+        invoices = store.collection('invoices')
+        self.assertEqual([invoices.get(record_id)['id'] for record_id in sorted(ids)], sorted(ids))
+
+
+class BulkTests(StoreTestCase):
+    def test_bulk_created_invoices_are_numbered_by_the_store(self):
+        taken = store.collection('invoices').get(1)['number']
+        response = self.client.post(
+            '/api/invoices/bulk/', {'create': [{'number': taken, 'customer_id': 1, 'total': 5}]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['created'][0]['number'], taken)
+        numbers = [record['number'] for record in store.collection('invoices').all()]
+        self.assertEqual(len(numbers), len(set(numbers)))
+
+
+class ListingTests(StoreTestCase):
+    def test_following_the_cursor_visits_every_record_once(self):
+        expected = [record['id'] for record in store.collection('invoices').all()]
+        for sort in ('', '&sort=-date', '&sort=status'):
+            with self.subTest(sort=sort):
+                seen = []
+                url = f'/api/invoices/?limit=4{sort}'
+                while url:
+                    page = self.client.get(url).json()
+                    seen += [record['id'] for record in page['results']]
+                    url = page['next'] and f'/api/invoices/?limit=4{sort}&cursor={page["next"]}'
+                self.assertCountEqual(seen, expected)
+
+
+class ImportTests(StoreTestCase):
+    def test_update_rows_leave_blank_cells_unchanged(self):
+        leads = store.collection('leads')
+        leads.update(1, {'status': 'won'})
+        before = leads.get(1)
+
+        response = self.client.post('/api/leads/import/', 'id,name,company,status\r\n1,Renamed,,\r\n', content_type='text/csv')
+
+        self.assertEqual(response.json(), {'created': 0, 'updated': 1, 'errors': []})
+        self.assertEqual(leads.get(1), {**before, 'name': 'Renamed'})
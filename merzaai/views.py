@@ -1,63 +1,75 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
-import json
-import os
 from datetime import datetime
 
+from . import metrics, store
+from .bulk import build_record, bulk_response
+from .conditional import conditional
+from .dates import add_months, date_ordinal, last_months, month_of, months_between
+from .events import bus
+from .executor import async_view
+from .listing import InvalidQuery, list_response, parse_fields, parse_limit, project
+from .tabular import export_response, import_response
+
+logger = logging.getLogger(__name__)
+
+@conditional('leads')
 @api_view(['GET'])
 def leads_api(request):
-    file_path = os.path.join(settings.JSON_DIR, 'leads.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    leads = data.get('leads', [])
-    return Response(leads)
+    return list_response(request, store.collection('leads'))
+
+
+@api_view(['POST'])
+def bulk_leads_api(request):
+    try:
+        return bulk_response(request, store.collection('leads'))
+    except Exception as e:
+        logger.exception("Error in bulk leads")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@conditional('leads')
+@api_view(['GET'])
+def export_leads_api(request):
+    try:
+        return export_response(request, store.collection('leads'))
+    except Exception as e:
+        logger.exception("Error exporting leads")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def import_leads_api(request):
+    try:
+        return import_response(request, store.collection('leads'))
+    except Exception as e:
+        logger.exception("Error importing leads")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['POST'])
 def add_lead_api(request):
-    print("Received lead data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'leads.json')
+    logger.debug("Received lead data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        leads = data.get('leads', [])
-        
-        # Generate new ID
-        new_id = max([lead.get('id', 0) for lead in leads], default=0) + 1
-        
-        # Create new lead
-        new_lead = {
-            "id": new_id,
-            "name": request.data.get('name'),
-            "company": request.data.get('company'),
-            "title": request.data.get('title', ''),
-            "email": request.data.get('email', ''),
-            "phone": request.data.get('phone', ''),
-            "address": request.data.get('address', ''),
-            "source": request.data.get('source', ''),
-            "status": request.data.get('status', 'new'),
-            "addedDate": request.data.get('addedDate', ''),
-            "lastContact": request.data.get('lastContact', ''),
-            "industry": request.data.get('industry', ''),
-            "annualRevenue": request.data.get('annualRevenue', ''),
-            "notes": request.data.get('notes', '')
-        }
-        
-        leads.append(new_lead)
-        data['leads'] = leads
+        # Create new lead (the store assigns the ID)
+        new_lead = build_record('leads', request.data)
         
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        new_lead = store.collection('leads').insert(new_lead)
         
-        print("Lead added successfully!")
+        logger.info("Lead added successfully")
         return Response(new_lead, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in add_lead_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
@@ -65,33 +77,15 @@ def add_lead_api(request):
 @api_view(['POST'])
 def convert_lead_to_customer(request, lead_id):
     try:
-        # Read leads.json
-        leads_path = os.path.join(settings.JSON_DIR, 'leads.json')
-        with open(leads_path, 'r') as f:
-            leads_data = json.load(f)
-        
         # Find the lead
-        lead = None
-        for l in leads_data['leads']:
-            if l['id'] == lead_id:
-                lead = l
-                break
+        leads = store.collection('leads')
+        lead = leads.get(lead_id)
         
         if not lead:
             return Response({"error": "Lead not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        # Read customers.json
-        customers_path = os.path.join(settings.JSON_DIR, 'customers.json')
-        with open(customers_path, 'r') as f:
-            customers_data = json.load(f)
-        
-        # Generate new customer ID
-        customers = customers_data.get('customers', [])
-        new_id = max([c.get('id', 0) for c in customers], default=0) + 1
-        
         # Create customer from lead
         new_customer = {
-            "id": new_id,
             "name": lead['name'],
             "company": lead['company'],
             "title": lead.get('title', ''),
@@ -100,249 +94,200 @@ def convert_lead_to_customer(request, lead_id):
             "address": lead.get('address', ''),
             "addedDate": "November 10, 2025",  # Simple string instead of datetime
             "notes": f"Converted from lead. Original notes: {lead.get('notes', '')}",
-            "totalInvoices": 0,
-            "totalAmount": 0,
-            "invoices": []
         }
         
-        # Add to customers
-        customers.append(new_customer)
-        customers_data['customers'] = customers
-        
-        # Update lead status to "won"
-        for l in leads_data['leads']:
-            if l['id'] == lead_id:
-                l['status'] = 'won'
-                break
-        
-        # Save both files
-        with open(customers_path, 'w') as f:
-            json.dump(customers_data, f, indent=2)
-        
-        with open(leads_path, 'w') as f:
-            json.dump(leads_data, f, indent=2)
+        # Add to customers and mark the lead "won", together
+        with store.unit_of_work('customers', 'leads') as work:
+            new_customer = work.insert('customers', new_customer)
+            work.update('leads', lead_id, {'status': 'won'})
         
-        return Response(new_customer, status=status.HTTP_201_CREATED)
+        return Response(with_invoice_totals([new_customer])[0], status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Error in convert_lead_to_customer:", str(e))  # Add this for debugging
+        logger.exception("Error in convert_lead_to_customer")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 @api_view(['DELETE'])
 def delete_lead_api(request, lead_id):
-    print(f"Deleting lead ID: {lead_id}")
-    file_path = os.path.join(settings.JSON_DIR, 'leads.json')
+    logger.info("Deleting lead ID: %s", lead_id)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        leads = data.get('leads', [])
-        initial_count = len(leads)
-        
-        # Filter out the lead to delete
-        leads = [lead for lead in leads if lead['id'] != lead_id]
-        
-        if len(leads) == initial_count:
+        if not store.collection('leads').delete(lead_id):
             return Response({"error": "Lead not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        data['leads'] = leads
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print("Lead deleted successfully!")
+        logger.info("Lead deleted successfully")
         return Response(status=status.HTTP_204_NO_CONTENT)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in delete_lead_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 def edit_api(request):
-    print("Received data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'leads.json')
+    logger.debug("Received data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        leads = data.get('leads', [])
-        
         lead_id = request.data.get('id')
-        for lead in leads:
-            if lead['id'] == lead_id:
-                lead.update(request.data)
-                break
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        store.collection('leads').update(lead_id, request.data)
         
-        print("Lead updated successfully!")
+        logger.info("Lead updated successfully")
         return Response(request.data)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in edit_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+def with_invoice_totals(customers):
+    """Copies of the customers with totalInvoices and totalAmount of their invoices."""
+    totals = store.collection('invoices').aggregate(
+        'customer_invoices', customer_ids=[customer['id'] for customer in customers],
+    )
+    return [
+        {
+            **{field: value for field, value in customer.items() if field not in store.LEGACY_CUSTOMER_FIELDS},
+            **totals[customer['id']],
+        }
+        for customer in customers
+    ]
+
+
+@conditional('customers', 'invoices')
 @api_view(['GET'])
 def customers_api(request):
-    file_path = os.path.join(settings.JSON_DIR, 'customers.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
+    return list_response(request, store.collection('customers'), derive=with_invoice_totals)
+
+
+@conditional('customers', 'invoices')
+@api_view(['GET'])
+def customer_invoices_api(request, customer_id):
+    """The customer's invoices, from the invoices' customer_id index."""
+    if store.collection('customers').get(customer_id) is None:
+        return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
+    invoices = store.collection('invoices').find(customer_id=customer_id)
+    return Response(project(invoices, parse_fields(request)))
 
-    customers = data.get('customers', [])
-    return Response(customers)
+
+@api_view(['POST'])
+def bulk_customers_api(request):
+    try:
+        return bulk_response(request, store.collection('customers'))
+    except Exception as e:
+        logger.exception("Error in bulk customers")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@conditional('customers', 'invoices')
+@api_view(['GET'])
+def export_customers_api(request):
+    try:
+        return export_response(request, store.collection('customers'), derive=with_invoice_totals)
+    except Exception as e:
+        logger.exception("Error exporting customers")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def import_customers_api(request):
+    try:
+        return import_response(request, store.collection('customers'))
+    except Exception as e:
+        logger.exception("Error importing customers")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 def edit_customer_api(request):
-    print("Received customer data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'customers.json')
+    logger.debug("Received customer data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        customers = data.get('customers', [])
-        
         customer_id = request.data.get('id')
-        for customer in customers:
-            if customer['id'] == customer_id:
-                customer.update(request.data)
-                break
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Invoice totals are derived from the invoices, not stored
+        changes = {
+            field: value for field, value in request.data.items()
+            if field not in store.LEGACY_CUSTOMER_FIELDS
+        }
+        store.collection('customers').update(customer_id, changes)
         
-        print("Customer updated successfully!")
+        logger.info("Customer updated successfully")
         return Response(request.data)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in edit_customer_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     
 
 @api_view(['POST'])
 def add_customer_api(request):
-    print("Received customer data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'customers.json')
+    logger.debug("Received customer data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        customers = data.get('customers', [])
-        
-        new_id = max([customer.get('id', 0) for customer in customers], default=0) + 1
-        
-        new_customer = {
-            "id": new_id,
-            "name": request.data.get('name'),
-            "company": request.data.get('company'),
-            "title": request.data.get('title', ''),
-            "email": request.data.get('email', ''),
-            "phone": request.data.get('phone', ''),
-            "address": request.data.get('address', ''),
-            "addedDate": request.data.get('addedDate', ''),
-            "notes": request.data.get('notes', ''),
-            "totalInvoices": request.data.get('totalInvoices', 0),
-            "totalAmount": request.data.get('totalAmount', 0),
-            "invoices": request.data.get('invoices', [])
-        }
+        new_customer = build_record('customers', request.data)
         
-        customers.append(new_customer)
-        data['customers'] = customers
+        new_customer = with_invoice_totals([store.collection('customers').insert(new_customer)])[0]
         
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print("Customer added successfully!")
+        logger.info("Customer added successfully")
         return Response(new_customer, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in add_customer_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
 @api_view(['DELETE'])
 def delete_customer_api(request, customer_id):
-    print(f"Deleting customer ID: {customer_id}")
-    file_path = os.path.join(settings.JSON_DIR, 'customers.json')
+    logger.info("Deleting customer ID: %s", customer_id)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        customers = data.get('customers', [])
-        initial_count = len(customers)
-        
-        # Filter out the customer to delete
-        customers = [customer for customer in customers if customer['id'] != customer_id]
-        
-        if len(customers) == initial_count:
+        if not store.collection('customers').delete(customer_id):
             return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        data['customers'] = customers
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print("Customer deleted successfully!")
+        logger.info("Customer deleted successfully")
         return Response(status=status.HTTP_204_NO_CONTENT)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in delete_customer_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@conditional('invoices')
 @api_view(['GET'])
 def invoices_api(request):
-    file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
+    return list_response(request, store.collection('invoices'))
 
-    invoices = data.get('invoices', [])
-    return Response(invoices)
+
+@api_view(['POST'])
+def bulk_invoices_api(request):
+    try:
+        return bulk_response(request, store.collection('invoices'))
+    except Exception as e:
+        logger.exception("Error in bulk invoices")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 def add_invoice_api(request):
-    print("Received invoice data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
+    logger.debug("Received invoice data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        invoices = data.get('invoices', [])
-        
-        new_id = max([invoice.get('id', 0) for invoice in invoices], default=0) + 1
-        invoice_count = len(invoices) + 1
-        invoice_number = f"INV-{invoice_count:04d}"
+        invoices = store.collection('invoices')
         
         customer_id = request.data.get('customer_id')
         customer_name = request.data.get('customer_name', '')
         customer_company = request.data.get('customer_company', '')
         
+        customers = store.collection('customers')
+        
         # If it's a regular customer invoice, get customer details
         if customer_id and customer_id != 'custom':
             try:
-                customers_path = os.path.join(settings.JSON_DIR, 'customers.json')
-                with open(customers_path, 'r') as f:
-                    customers_data = json.load(f)
-                
-                customers = customers_data.get('customers', [])
-                for customer in customers:
-                    if customer['id'] == customer_id:
-                        customer_name = f"{customer['company']} - {customer['name']}"
-                        customer_company = customer['company']
-                        break
-            except Exception as e:
-                print("Error fetching customer details:", str(e))
+                customer = customers.get(customer_id)
+                if customer:
+                    customer_name = f"{customer['company']} - {customer['name']}"
+                    customer_company = customer['company']
+            except Exception:
+                logger.exception("Error fetching customer details")
         
         # Create new invoice
         new_invoice = {
-            "id": new_id,
-            "number": invoice_number,
+            "number": None,  # The next INV- number, assigned as it is saved
             "customer": customer_name,
             "customer_id": customer_id if customer_id != 'custom' else None,
             "customer_company": customer_company,
@@ -354,77 +299,23 @@ def add_invoice_api(request):
             "vat": request.data.get('vat', 0),
             "total": request.data.get('total', 0)
         }
-        print(new_invoice,"fellix")
-        invoices.append(new_invoice)
-        data['invoices'] = invoices
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        new_invoice = invoices.insert(new_invoice, number_prefix='INV-')
+        logger.debug("New invoice: %s", new_invoice)
         
-        # Update customer record if it's a regular customer
-        if customer_id and customer_id != 'custom':
-            try:
-                customers_path = os.path.join(settings.JSON_DIR, 'customers.json')
-                with open(customers_path, 'r') as f:
-                    customers_data = json.load(f)
-                
-                customers = customers_data.get('customers', [])
-                for customer in customers:
-                    if customer['id'] == customer_id:
-                        # Add invoice to customer's invoices array
-                        customer_invoice = {
-                            "number": invoice_number,
-                            "date": request.data.get('date'),
-                            "amount": request.data.get('total', 0),
-                            "status": request.data.get('status', 'draft')
-                        }
-                        
-                        if 'invoices' not in customer:
-                            customer['invoices'] = []
-                        
-                        customer['invoices'].append(customer_invoice)
-                        
-                        # Update customer totals
-                        customer['totalInvoices'] = len(customer['invoices'])
-                        customer['totalAmount'] = sum(inv.get('amount', 0) for inv in customer['invoices'])
-                        
-                        break
-                
-                # Save updated customers data
-                with open(customers_path, 'w') as f:
-                    json.dump(customers_data, f, indent=2)
-                
-                print("Customer record updated successfully!")
-                
-            except Exception as e:
-                print("Error updating customer record:", str(e))
-        
-        print("Invoice added successfully!")
+        logger.info("Invoice added successfully")
         return Response(new_invoice, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in add_invoice_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 
 @api_view(['POST'])
 def add_custom_invoice_api(request):
-    print("Received custom invoice data:", request.data)
-    invoices_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-    customers_path = os.path.join(settings.JSON_DIR, 'customers.json')
+    logger.debug("Received custom invoice data: %s", request.data)
 
     try:
-        # Read invoices data
-        with open(invoices_path, 'r') as f:
-            invoices_data = json.load(f)
-        
-        invoices = invoices_data.get('invoices', [])
-        
-        new_id = max([invoice.get('id', 0) for invoice in invoices], default=0) + 1
-        invoice_count = len(invoices) + 1
-        invoice_number = f"INV-CUST-{invoice_count:04d}"
-        
         custom_details = request.data.get('custom_details', {})
         add_as_customer = request.data.get('add_as_customer', True)  # Default to True for "Save Customer"
         
@@ -432,10 +323,9 @@ def add_custom_invoice_api(request):
         
         # Create new invoice
         new_invoice = {
-            "id": new_id,
-            "number": invoice_number,
+            "number": None,  # The next INV-CUST- number, assigned as it is saved
             "customer": customer_name,
-            "customer_id": None,  # No customer ID for custom invoices
+            "customer_id": None,  # Set below if the customer is saved
             "customer_company": custom_details.get('companyName', ''),
             "custom_details": custom_details,
             "date": request.data.get('date'),
@@ -447,25 +337,12 @@ def add_custom_invoice_api(request):
             "vat": request.data.get('vat', 0),
             "total": request.data.get('total', 0)
         }
-        print(new_invoice)
-        invoices.append(new_invoice)
-        invoices_data['invoices'] = invoices
-        
-        # Save invoice
-        with open(invoices_path, 'w') as f:
-            json.dump(invoices_data, f, indent=2)
         
-        # Add as customer (always True for "Save Customer" button)
-        if add_as_customer:
-            try:
-                with open(customers_path, 'r') as f:
-                    customers_data = json.load(f)
-                
-                customers = customers_data.get('customers', [])
-                new_customer_id = max([c.get('id', 0) for c in customers], default=0) + 1
-                
-                new_customer = {
-                    "id": new_customer_id,
+        # Save the invoice and, for "Save Customer" (the default), its new
+        # customer together, the invoice linked to the customer
+        with store.unit_of_work('customers', 'invoices') as work:
+            if add_as_customer:
+                new_customer = work.insert('customers', {
                     "name": custom_details.get('contactPerson', ''),
                     "company": custom_details.get('companyName', ''),
                     "title": custom_details.get('title', ''), 
@@ -475,118 +352,66 @@ def add_custom_invoice_api(request):
                     "trn": custom_details.get('trnNumber', ''),
                     "addedDate": datetime.now().strftime("%B %d, %Y"),
                     "notes": "Added from custom invoice",
-                    "totalInvoices": 1,
-                    "totalAmount": request.data.get('total', 0),
-                    "invoices": [{
-                        "number": invoice_number,
-                        "date": request.data.get('date'),
-                        "amount": request.data.get('total', 0),
-                        "status": request.data.get('status', 'draft')
-                    }]
-                }
-                
-                customers.append(new_customer)
-                customers_data['customers'] = customers
-                
-                with open(customers_path, 'w') as f:
-                    json.dump(customers_data, f, indent=2)
-                
-                print("Custom invoice customer added successfully!")
-                
-            except Exception as e:
-                print("Error adding custom invoice customer:", str(e))
-        
-        print("Custom invoice added successfully!")
+                })
+                new_invoice["customer_id"] = new_customer['id']
+            new_invoice = work.insert('invoices', new_invoice, number_prefix='INV-CUST-')
+        logger.debug("New invoice: %s", new_invoice)
+        
+        logger.info("Custom invoice added successfully")
         return Response(new_invoice, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in add_custom_invoice_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['POST'])
 def edit_invoice_api(request):
-    print("Received invoice data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
+    logger.debug("Received invoice data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        invoices = data.get('invoices', [])
+        invoices = store.collection('invoices')
         
         invoice_id = request.data.get('id')
-        for invoice in invoices:
-            if invoice['id'] == invoice_id:
-                invoice.update({
-                    "customer": request.data.get('customer', invoice['customer']),
-                    "date": request.data.get('date', invoice['date']),
-                    "dueDate": request.data.get('dueDate', invoice['dueDate']),
-                    "status": request.data.get('status', invoice['status']),
-                    "items": request.data.get('items', invoice['items']),
-                    "subtotal": request.data.get('subtotal', invoice['subtotal']),
-                    "vat": request.data.get('vat', invoice['vat']),
-                    "total": request.data.get('total', invoice['total'])
-                })
-                break
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print("Invoice updated successfully!")
+        invoice = invoices.get(invoice_id)
+        if invoice:
+            invoices.update(invoice_id, {
+                "customer": request.data.get('customer', invoice['customer']),
+                "date": request.data.get('date', invoice['date']),
+                "dueDate": request.data.get('dueDate', invoice['dueDate']),
+                "status": request.data.get('status', invoice['status']),
+                "items": request.data.get('items', invoice['items']),
+                "subtotal": request.data.get('subtotal', invoice['subtotal']),
+                "vat": request.data.get('vat', invoice['vat']),
+                "total": request.data.get('total', invoice['total'])
+            })
+        
+        logger.info("Invoice updated successfully")
         return Response(request.data)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in edit_invoice_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['DELETE'])
 def delete_invoice_api(request, invoice_id):
-    print(f"Deleting invoice ID: {invoice_id}")
-    file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
+    logger.info("Deleting invoice ID: %s", invoice_id)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        invoices = data.get('invoices', [])
-        initial_count = len(invoices)
-        
-        # Filter out the invoice to delete
-        invoices = [invoice for invoice in invoices if invoice['id'] != invoice_id]
-        
-        if len(invoices) == initial_count:
+        if not store.collection('invoices').delete(invoice_id):
             return Response({"error": "Invoice not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        data['invoices'] = invoices
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print("Invoice deleted successfully!")
+        logger.info("Invoice deleted successfully")
         return Response(status=status.HTTP_204_NO_CONTENT)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in delete_invoice_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 def mark_invoice_sent(request, invoice_id):
     try:
-        file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-        
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        invoices = data.get('invoices', [])
-        
-        for invoice in invoices:
-            if invoice['id'] == invoice_id:
-                invoice['status'] = 'sent'
-                break
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        store.collection('invoices').update(invoice_id, {'status': 'sent'})
         
         return Response({"message": "Invoice marked as sent"})
         
@@ -594,65 +419,29 @@ def mark_invoice_sent(request, invoice_id):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@conditional('invoices')
 @api_view(['GET'])
 def invoice_summary_api(request):
     try:
-        invoices_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-        
-        with open(invoices_path, 'r') as f:
-            invoices_data = json.load(f)
-        
-        invoices = invoices_data.get('invoices', [])
-        
-        # Total Sales - ALL invoices (not just MTD)
-        total_sales = sum(
-            float(invoice.get('total', 0) or 0)
-            for invoice in invoices
-        )
-        
-        # Total Receivables - all unpaid invoices
-        total_receivables = sum(
-            float(invoice.get('total', 0) or 0)
-            for invoice in invoices
-            if invoice.get('status') != 'paid'
-        )
-        
-        # Total Cash Collected - ALL paid invoices (not just MTD)
-        total_cash_collected = sum(
-            float(invoice.get('total', 0) or 0)
-            for invoice in invoices
-            if invoice.get('status') == 'paid'
-        )
+        # Running totals kept up to date by the store on every invoice write
+        totals = store.collection('invoices').aggregate('invoice_totals')
         
         summary_data = {
-            'totalSales': round(total_sales, 2),
-            'totalReceivables': round(total_receivables, 2),
-            'totalCashCollected': round(total_cash_collected, 2)
+            'totalSales': round(totals['sales'], 2),  # ALL invoices (not just MTD)
+            'totalReceivables': round(totals['receivables'], 2),  # all unpaid invoices
+            'totalCashCollected': round(totals['cashCollected'], 2)  # ALL paid invoices
         }
         
         return Response(summary_data)
         
     except Exception as e:
-        print("Error in invoice summary:", str(e))
+        logger.exception("Error in invoice summary")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 def mark_invoice_paid(request, invoice_id):
     try:
-        file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-        
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        invoices = data.get('invoices', [])
-        
-        for invoice in invoices:
-            if invoice['id'] == invoice_id:
-                invoice['status'] = 'paid'
-                break
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        store.collection('invoices').update(invoice_id, {'status': 'paid'})
         
         return Response({"message": "Invoice marked as paid"})
         
@@ -662,57 +451,32 @@ def mark_invoice_paid(request, invoice_id):
 
 @api_view(['POST'])
 def mark_invoice_paid_api(request, invoice_id):
-    print(f"Marking invoice {invoice_id} as paid")
-    file_path = os.path.join(settings.JSON_DIR, 'invoices.json')
+    logger.info("Marking invoice %s as paid", invoice_id)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        store.collection('invoices').update(invoice_id, {'status': 'paid'})
         
-        invoices = data.get('invoices', [])
-        
-        for invoice in invoices:
-            if invoice['id'] == invoice_id:
-                invoice['status'] = 'paid'
-                break
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print("Invoice marked as paid successfully!")
+        logger.info("Invoice marked as paid successfully")
         return Response({"message": "Invoice marked as paid"})
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in mark_invoice_paid_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Payments APIs
+@conditional('payments')
 @api_view(['GET'])
 def payments_api(request):
-    file_path = os.path.join(settings.JSON_DIR, 'payments.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-
-    payments = data.get('payments', [])
+    payments = store.collection('payments').all()
     return Response(payments)
 
 @api_view(['POST'])
 def add_payment_api(request):
-    print("Received payment data:", request.data)
-    file_path = os.path.join(settings.JSON_DIR, 'payments.json')
+    logger.debug("Received payment data: %s", request.data)
 
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        payments = data.get('payments', [])
-        
-        # Generate new ID
-        new_id = max([payment.get('id', 0) for payment in payments], default=0) + 1
-        
         # Create new payment
         new_payment = {
-            "id": new_id,
             "invoice_id": request.data.get('invoice_id'),
             "invoice_number": request.data.get('invoice_number'),
             "customer": request.data.get('customer'),
@@ -722,68 +486,36 @@ def add_payment_api(request):
             "reference": request.data.get('reference', '')
         }
         
-        payments.append(new_payment)
-        data['payments'] = payments
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        # Update invoice status to paid
-        invoices_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-        with open(invoices_path, 'r') as f:
-            invoices_data = json.load(f)
+        # Record the payment and mark the invoice paid, together
+        with store.unit_of_work('payments', 'invoices') as work:
+            new_payment = work.insert('payments', new_payment)
+            work.update('invoices', request.data.get('invoice_id'), {'status': 'paid'})
         
-        invoices = invoices_data.get('invoices', [])
-        for invoice in invoices:
-            if invoice['id'] == request.data.get('invoice_id'):
-                invoice['status'] = 'paid'
-                break
-        
-        with open(invoices_path, 'w') as f:
-            json.dump(invoices_data, f, indent=2)
-        
-        print("Payment added and invoice updated successfully!")
+        logger.info("Payment added and invoice updated successfully")
         return Response(new_payment, status=status.HTTP_201_CREATED)
         
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Error in add_payment_api")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
 
 
+@conditional('accounts')
 @api_view(['GET'])
 def chart_of_accounts_api(request):
-    file_path = os.path.join(settings.JSON_DIR, 'chart_of_accounts.json')
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        accounts = data.get('COA', [])
-        # Add IDs if not present
-        for index, account in enumerate(accounts, 1):
-            if 'id' not in account:
-                account['id'] = index
-        return Response(accounts)
+        # The store gives records saved without an id one when it loads them
+        return Response(store.collection('accounts').all())
     except FileNotFoundError:
         return Response([], status=status.HTTP_404_NOT_FOUND)
 
 @api_view(['POST'])
 def add_account_api(request):
-    file_path = os.path.join(settings.JSON_DIR, 'chart_of_accounts.json')
     try:
-        # Try to read existing file
-        try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            data = {"COA": []}
-        
-        accounts = data.get('COA', [])
-        
         # Convert vatApplicable to string for consistency
         vat_applicable = "Yes" if request.data.get('vatApplicable') else "No"
         
         new_account = {
-            "id": len(accounts) + 1,
             "accountCode": request.data.get('accountCode'),
             "accountName": request.data.get('accountName'),
             "accountType": request.data.get('accountType'),
@@ -791,11 +523,7 @@ def add_account_api(request):
             "vatApplicable": vat_applicable
         }
         
-        accounts.append(new_account)
-        data['COA'] = accounts
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        new_account = store.collection('accounts').insert(new_account)
         
         return Response(new_account, status=status.HTTP_201_CREATED)
         
@@ -805,142 +533,133 @@ def add_account_api(request):
 
 @api_view(['POST'])
 def edit_account_api(request, account_id):
-    file_path = os.path.join(settings.JSON_DIR, 'chart_of_accounts.json')
-    print(f"Editing account {account_id}")  # Debug line
+    logger.info("Editing account %s", account_id)
     
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        accounts = data.get('COA', [])
-        account_found = False
-        
-        for account in accounts:
-            if account.get('id') == account_id:
-                # Convert vatApplicable to string for consistency
-                vat_applicable = "Yes" if request.data.get('vatApplicable') else "No"
-                
-                account.update({
-                    "accountCode": request.data.get('accountCode'),
-                    "accountName": request.data.get('accountName'),
-                    "accountType": request.data.get('accountType'),
-                    "description": request.data.get('description', ''),
-                    "vatApplicable": vat_applicable
-                })
-                account_found = True
-                print(f"Account updated: {account}")  # Debug line
-                break
+        # Convert vatApplicable to string for consistency
+        vat_applicable = "Yes" if request.data.get('vatApplicable') else "No"
         
-        if not account_found:
-            print(f"Account with ID {account_id} not found")  # Debug line
-            return Response({"error": "Account not found"}, status=status.HTTP_404_NOT_FOUND)
+        account = store.collection('accounts').update(account_id, {
+            "accountCode": request.data.get('accountCode'),
+            "accountName": request.data.get('accountName'),
+            "accountType": request.data.get('accountType'),
+            "description": request.data.get('description', ''),
+            "vatApplicable": vat_applicable
+        })
         
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        if account is None:
+            logger.warning("Account with ID %s not found", account_id)
+            return Response({"error": "Account not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        print("Account file saved successfully")  # Debug line
+        logger.debug("Account updated: %s", account)
         return Response({"message": "Account updated successfully"})
         
     except Exception as e:
-        print(f"Error updating account: {str(e)}")  # Debug line
+        logger.exception("Error updating account")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['DELETE'])
 def delete_account_api(request, account_id):
-    file_path = os.path.join(settings.JSON_DIR, 'chart_of_accounts.json')
-    print(f"Deleting account {account_id}")  # Debug line
+    logger.info("Deleting account %s", account_id)
     
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        
-        accounts = data.get('COA', [])
-        initial_count = len(accounts)
-        
-        # Filter out the account to delete
-        accounts = [acc for acc in accounts if acc.get('id') != account_id]
-        
-        if len(accounts) == initial_count:
-            print(f"Account with ID {account_id} not found for deletion")  # Debug line
+        if not store.collection('accounts').delete(account_id):
+            logger.warning("Account with ID %s not found for deletion", account_id)
             return Response({"error": "Account not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        data['COA'] = accounts
-        
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print(f"Account {account_id} deleted successfully")  # Debug line
+        logger.info("Account %s deleted successfully", account_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
         
     except Exception as e:
-        print(f"Error deleting account: {str(e)}")  # Debug line
+        logger.exception("Error deleting account")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-from datetime import datetime, timedelta
+SEARCHABLE = ('leads', 'customers', 'invoices')
+
+
+@conditional(*SEARCHABLE)
+@api_view(['GET'])
+def search_api(request):
+    try:
+        text = request.query_params.get('q', '')
+        types = request.query_params.get('types')
+        types = types.split(',') if types else SEARCHABLE
+        unknown = [name for name in types if name not in SEARCHABLE]
+        if unknown:
+            raise InvalidQuery(f"Cannot search {', '.join(unknown)}; use one of: {', '.join(SEARCHABLE)}")
+        limit = parse_limit(request)
+        fields = parse_fields(request)
+
+        # Each collection's best `limit` matches, merged by score
+        matches = [
+            (score, name, record)
+            for name in types
+            for record, score in store.collection(name).search(text, limit)
+        ]
+        matches.sort(key=lambda match: -match[0])
+        matches = matches[:limit]
+        customers = iter(with_invoice_totals([record for _, name, record in matches if name == 'customers']))
+        results = [
+            {
+                'type': name, 'id': record['id'], 'score': round(score, 4),
+                'record': next(customers) if name == 'customers' else record,
+            }
+            for score, name, record in matches
+        ]
+        if fields is not None:
+            for result in results:
+                result['record'] = project([result['record']], fields)[0]
+        return Response({'results': results})
+
+    except InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.exception("Error in search")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
+@conditional('leads', 'customers', 'invoices', daily=True)
 @api_view(['GET'])
 def dashboard_metrics_api(request):
     try:
-        # Read all data files
-        leads_path = os.path.join(settings.JSON_DIR, 'leads.json')
-        customers_path = os.path.join(settings.JSON_DIR, 'customers.json')
-        invoices_path = os.path.join(settings.JSON_DIR, 'invoices.json')
-        
-        with open(leads_path, 'r') as f:
-            leads_data = json.load(f)
-        with open(customers_path, 'r') as f:
-            customers_data = json.load(f)
-        with open(invoices_path, 'r') as f:
-            invoices_data = json.load(f)
-        
-        leads = leads_data.get('leads', [])
-        customers = customers_data.get('customers', [])
-        invoices = invoices_data.get('invoices', [])
-        
-        # Debug: Print invoice data to see what we have
-        print("=== INVOICES DATA ===")
-        for inv in invoices:
-            print(f"Invoice {inv.get('number')}: Status={inv.get('status')}, Total={inv.get('total')}, Date={inv.get('date')}")
+        # Running aggregates kept up to date by the store on every write
+        leads = store.collection('leads')
+        invoices = store.collection('invoices')
+        lead_stats = leads.aggregate('lead_stats')
+        invoice_totals = invoices.aggregate('invoice_totals')
         
         # Calculate metrics - SIMPLIFIED VERSION
-        total_leads = len(leads)
-        active_customers = len(customers)
+        total_leads = lead_stats['count']
+        active_customers = store.collection('customers').count()
         
         # Outstanding invoices (all unpaid)
-        outstanding_invoices = sum(
-            float(invoice.get('total', 0) or 0) 
-            for invoice in invoices 
-            if invoice.get('status') != 'paid'
-        )
+        outstanding_invoices = invoice_totals['receivables']
         
         # Cash received - ALL paid invoices (remove date filter for now)
-        cash_received = sum(
-            float(invoice.get('total', 0) or 0)
-            for invoice in invoices
-            if invoice.get('status') == 'paid'
-        )
+        cash_received = invoice_totals['cashCollected']
         
         # Sales - ALL invoices
-        total_sales = sum(
-            float(invoice.get('total', 0) or 0)
-            for invoice in invoices
-        )
+        total_sales = invoice_totals['sales']
+        
+        # Monthly sales and collections, oldest month first
+        months = parse_chart_months(request)
+        sales_data, collection_data = get_monthly_trend_data(invoices, months)
         
         # Recent leads (last 4)
-        recent_leads = leads[-4:] if len(leads) > 4 else leads
+        recent_leads = leads.last(4)
         
-        # Unpaid invoices
-        unpaid_invoices = [inv for inv in invoices if inv.get('status') != 'paid'][-4:]
+        # Unpaid invoices (last 4)
+        unpaid_invoices = get_recent_unpaid_invoices(invoices, 4)
         
         # Quick stats
-        conversion_rate = calculate_conversion_rate(leads)
-        avg_invoice_value = calculate_avg_invoice_value(invoices)
+        conversion_rate = calculate_conversion_rate(lead_stats)
+        avg_invoice_value = calculate_avg_invoice_value(invoice_totals)
         payment_cycle = 32  # Default value
         
         # Debug output
-        print(f"Total paid invoices: {len([inv for inv in invoices if inv.get('status') == 'paid'])}")
-        print(f"Cash received total: {cash_received}")
+        logger.debug("Total paid invoices: %s", invoice_totals['paidCount'])
+        logger.debug("Cash received total: %s", cash_received)
         
         response_data = {
             'metrics': {
@@ -952,8 +671,8 @@ def dashboard_metrics_api(request):
                 'totalReceivables': round(outstanding_invoices, 2),
             },
             'trends': {
-                'salesTrend': 12.5,  # Hardcoded for now
-                'cashTrend': 15.2,   # Hardcoded for now
+                'salesTrend': calculate_trend(sales_data[-1], sales_data[-2]),
+                'cashTrend': calculate_trend(collection_data[-1], collection_data[-2]),
             },
             'recentLeads': recent_leads,
             'unpaidInvoices': unpaid_invoices,
@@ -963,132 +682,220 @@ def dashboard_metrics_api(request):
                 'paymentCycle': payment_cycle
             },
             'charts': {
-                'salesTrendData': [15000, 18000, 21000],  # Hardcoded for now
-                'collectionTrendData': [12000, 15000, 18000]  # Hardcoded for now
+                'months': [f"{year}-{month:02d}" for year, month in last_months(months)],
+                'salesTrendData': sales_data,
+                'collectionTrendData': collection_data,
             }
         }
         
         return Response(response_data)
         
+    except InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print("Error in dashboard metrics:", str(e))
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in dashboard metrics")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # Keep helper functions but simplify for now
-def calculate_conversion_rate(leads):
-    if not leads:
+def calculate_conversion_rate(lead_stats):
+    if not lead_stats['count']:
         return 0
-    won_leads = len([lead for lead in leads if lead.get('status') == 'won'])
-    return round((won_leads / len(leads)) * 100, 1)
+    return round((lead_stats['won'] / lead_stats['count']) * 100, 1)
 
-def calculate_avg_invoice_value(invoices):
-    if not invoices:
+def calculate_avg_invoice_value(invoice_totals):
+    if not invoice_totals['count']:
         return 0
-    total = sum(float(inv.get('total', 0) or 0) for inv in invoices)
-    return round(total / len(invoices), 2)
+    return round(invoice_totals['sales'] / invoice_totals['count'], 2)
 
 
 # Helper functions
-def is_current_month(date_str):
-    try:
-        if not date_str:
-            return False
-        # Handle different date formats
-        if '-' in date_str:
-            invoice_date = datetime.strptime(date_str, '%Y-%m-%d')
-        else:
-            invoice_date = datetime.strptime(date_str, '%B %d, %Y')
-        
-        current_date = datetime.now()
-        return invoice_date.month == current_date.month and invoice_date.year == current_date.year
-    except:
-        return False
-
-def calculate_previous_month_sales(invoices):
-    current = datetime.now()
-    prev_month = current.month - 1 if current.month > 1 else 12
-    prev_year = current.year if current.month > 1 else current.year - 1
-    
-    return sum(
-        float(invoice.get('total', 0))
-        for invoice in invoices
-        if is_specific_month(invoice.get('date', ''), prev_month, prev_year)
-    )
+def get_recent_unpaid_invoices(invoices, count):
+    # Every status except 'paid', resolved through the status index
+    statuses = [s for s in invoices.distinct('status') if s != 'paid']
+    return invoices.last(count, status=statuses)
 
-def calculate_previous_month_cash(invoices):
-    current = datetime.now()
-    prev_month = current.month - 1 if current.month > 1 else 12
-    prev_year = current.year if current.month > 1 else current.year - 1
-    
-    return sum(
-        float(invoice.get('total', 0))
-        for invoice in invoices
-        if invoice.get('status') == 'paid' and is_specific_month(invoice.get('date', ''), prev_month, prev_year)
-    )
-
-def is_specific_month(date_str, month, year):
+def parse_chart_months(request):
+    # At least two months, so there is a previous month to compare with
     try:
-        if not date_str:
-            return False
-        if '-' in date_str:
-            invoice_date = datetime.strptime(date_str, '%Y-%m-%d')
-        else:
-            invoice_date = datetime.strptime(date_str, '%B %d, %Y')
-        
-        return invoice_date.month == month and invoice_date.year == year
-    except:
-        return False
+        months = int(request.query_params.get('months', 3))
+    except ValueError:
+        raise InvalidQuery("months must be an integer")
+    if not 2 <= months <= 36:
+        raise InvalidQuery("months must be between 2 and 36")
+    return months
 
 def calculate_trend(current, previous):
     if previous == 0:
         return 0
     return round(((current - previous) / previous) * 100, 1)
 
+def get_monthly_trend_data(invoices, months=3):
+    # Sales and collections of the last `months` months, oldest to newest,
+    # read from the monthly rollup the store keeps on every invoice write
+    window = last_months(months)
+    rollup = invoices.aggregate('monthly_invoices', start=window[0], end=window[-1])
+    sales_data, collection_data = [], []
+    for month in window:
+        figures = month_figures(rollup.get(month))
+        sales_data.append(figures['sales'])
+        collection_data.append(figures['cashCollected'])
+    return sales_data, collection_data
+
+def month_figures(totals):
+    # A month of the rollup; months without invoices have no entry
+    totals = totals or {}
+    return {
+        'count': totals.get('count', 0),
+        'sales': round(totals.get('sales', 0), 2),
+        'cashCollected': round(totals.get('cashCollected', 0), 2),
+        'receivables': round(totals.get('receivables', 0), 2),
+    }
+
+# Longest range dashboard_trends_api will return, in months
+MAX_TREND_MONTHS = 240
+
+def parse_month(request, param):
+    # "2026-03", or any date in a format the JSON files use
+    raw = request.query_params.get(param)
+    if not raw:
+        return None
+    parts = raw.split('-')
+    if len(parts) == 2 and all(part.isdigit() for part in parts) and 1 <= int(parts[1]) <= 12:
+        return int(parts[0]), int(parts[1])
+    ordinal = date_ordinal(raw)
+    if ordinal is None:
+        raise InvalidQuery(f"{param} must be a month (YYYY-MM) or a date")
+    return month_of(ordinal)
+
+def parse_trend_range(request):
+    # ?from=&to= months, or the last ?months= months (12 by default)
+    start = parse_month(request, 'from')
+    end = parse_month(request, 'to') or last_months(1)[0]
+    if start is None:
+        try:
+            months = int(request.query_params.get('months', 12))
+        except ValueError:
+            raise InvalidQuery("months must be an integer")
+        if months < 1:
+            raise InvalidQuery("months must be positive")
+        if months > MAX_TREND_MONTHS:
+            raise InvalidQuery(f"A trend may span at most {MAX_TREND_MONTHS} months")
+        start = add_months(end, 1 - months)
+    if start > end:
+        raise InvalidQuery("from must not be after to")
+    # Counted, not listed: the bound is what keeps the list small
+    if (end[0] - start[0]) * 12 + end[1] - start[1] + 1 > MAX_TREND_MONTHS:
+        raise InvalidQuery(f"A trend may span at most {MAX_TREND_MONTHS} months")
+    return start, end
+
+@conditional('invoices', daily=True)
+@api_view(['GET'])
+def dashboard_trends_api(request):
+    """Monthly sales and collections over a range, month-to-date and month-over-month."""
+    try:
+        start, end = parse_trend_range(request)
+        customer_id = request.query_params.get('customer_id')
+        if customer_id:
+            try:
+                customer_id = int(customer_id)
+            except ValueError:
+                raise InvalidQuery("customer_id must be an integer")
+        else:
+            customer_id = None
+
+        invoices = store.collection('invoices')
+        # From the month before the range, for its first month-over-month change
+        first = add_months(start, -1)
+        previous_month, current_month = last_months(2)
+        rollup = invoices.aggregate(
+            'monthly_invoices', start=min(first, previous_month),
+            end=max(end, current_month), customer_id=customer_id,
+        )
 
+        months = []
+        previous = month_figures(rollup.get(first))
+        for month in months_between(start, end):
+            figures = month_figures(rollup.get(month))
+            months.append({
+                'month': f"{month[0]}-{month[1]:02d}",
+                **figures,
+                'salesTrend': calculate_trend(figures['sales'], previous['sales']),
+                'cashTrend': calculate_trend(figures['cashCollected'], previous['cashCollected']),
+            })
+            previous = figures
+
+        mtd = month_figures(rollup.get(current_month))
+        last_month = month_figures(rollup.get(previous_month))
+        return Response({
+            'from': months[0]['month'],
+            'to': months[-1]['month'],
+            'months': months,
+            'mtd': mtd,
+            'previousMonth': last_month,
+            'trends': {
+                'salesTrend': calculate_trend(mtd['sales'], last_month['sales']),
+                'cashTrend': calculate_trend(mtd['cashCollected'], last_month['cashCollected']),
+            },
+        })
 
+    except InvalidQuery as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.exception("Error in dashboard trends")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-
-def get_sales_trend_data(invoices):
-    # Last 3 months sales data
-    current = datetime.now()
-    months_data = []
-    
-    for i in range(3):
-        month = current.month - i
-        year = current.year
-        if month <= 0:
-            month += 12
-            year -= 1
-        
-        month_sales = sum(
-            float(inv.get('total', 0))
-            for inv in invoices
-            if is_specific_month(inv.get('date', ''), month, year)
-        )
-        months_data.append(round(month_sales, 2))
-    
-    return list(reversed(months_data))  # Oldest to newest
-
-def get_collection_trend_data(invoices):
-    # Last 3 months collection data
-    current = datetime.now()
-    months_data = []
-    
-    for i in range(3):
-        month = current.month - i
-        year = current.year
-        if month <= 0:
-            month += 12
-            year -= 1
-        
-        month_collections = sum(
-            float(inv.get('total', 0))
-            for inv in invoices
-            if inv.get('status') == 'paid' and is_specific_month(inv.get('date', ''), month, year)
-        )
-        months_data.append(round(month_collections, 2))
-    
-    return list(reversed(months_data))
\ No newline at end of file
+@require_GET
+def metrics_api(request):
+    """Request, JSON and storage metrics of this process, for Prometheus to scrape."""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+async def events_api(request):
+    """
+    Server-sent store change events for live dashboards (see merzaai.events),
+    optionally only of ?collections=a,b. Needs an ASGI server.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "Live events need the ASGI server"}, status=501)
+    names = request.GET.get('collections')
+    collections = None
+    if names:
+        collections = {name.strip() for name in names.split(',') if name.strip()}
+        unknown = collections - set(store.COLLECTIONS)
+        if unknown:
+            return JsonResponse({"error": f"Unknown collections: {', '.join(sorted(unknown))}"}, status=400)
+
+    async def stream():
+        # Subscribed on the server's event loop, where the stream is consumed
+        subscription = bus.subscribe(collections)
+        keepalive = getattr(settings, 'EVENTS_KEEPALIVE', 15)
+        try:
+            yield b'retry: 3000\n\n'
+            while True:
+                try:
+                    frame = await subscription.get(keepalive)
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+                    continue
+                if frame is None:
+                    logger.info("Dropped a live events client that fell behind")
+                    break
+                yield frame
+        finally:
+            bus.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Async versions of the read endpoints, routed to under ASGI (see merzaai.executor)
+leads_api_async = async_view(leads_api)
+customers_api_async = async_view(customers_api)
+invoices_api_async = async_view(invoices_api)
+invoice_summary_api_async = async_view(invoice_summary_api)
+dashboard_metrics_api_async = async_view(dashboard_metrics_api, preload=('leads', 'customers', 'invoices'))
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testcm.settings')
+# Route the read endpoints to their async versions
+os.environ.setdefault('MERZAAI_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
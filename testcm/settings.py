@@ -18,7 +18,64 @@ import os
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-JSON_DIR = os.path.join(BASE_DIR, 'merzaai', 'json')
+# Overridable so a server can run against other data (e.g. `manage.py benchmark` output)
+JSON_DIR = os.environ.get('MERZAAI_JSON_DIR', os.path.join(BASE_DIR, 'merzaai', 'json'))
+
+# Seconds the store waits for concurrent mutations to join a single rewrite
+STORE_GROUP_COMMIT_WINDOW = 0.002
+
+# Size of a collection's operation log that triggers folding it into the snapshot
+STORE_LOG_COMPACT_BYTES = 1024 * 1024
+
+# Size of the JSON backend's multi-collection write journal that triggers
+# emptying it (once nothing in it is pending)
+STORE_JOURNAL_CHECKPOINT_BYTES = 1024 * 1024
+
+# Ids each worker reserves at a time from a collection's id sequence; 1 keeps
+# ids in creation order across workers at the cost of a write per insert
+STORE_ID_BLOCK_SIZE = 100
+
+# Where the store keeps collections: 'json' (files under JSON_DIR) or 'sqlite'
+# (the merzaai models; run `manage.py migrate` and `manage.py import_json` first)
+STORE_BACKEND = 'json'
+
+# Operations kept in StoreOperation for other workers to catch up from (sqlite backend)
+STORE_OPERATIONS_KEEP = 10000
+
+# Page size of the list endpoints when ?limit= / ?cursor= are used
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Most items a /bulk/ request may create, update and delete in total
+API_MAX_BULK_SIZE = 10000
+
+# Rows applied per store batch by the CSV/XLSX import endpoints
+API_IMPORT_BATCH_SIZE = 1000
+
+# Records encoded per chunk by the ?stream= mode of the list endpoints
+API_STREAM_CHUNK_SIZE = 500
+
+# Smallest response body, in bytes, that CompressionMiddleware compresses
+COMPRESS_MIN_SIZE = 1024
+
+# Serve the read endpoints with their async versions (merzaai.executor), on a
+# pool of ASYNC_STORE_WORKERS threads. testcm/asgi.py turns this on.
+ASYNC_VIEWS = os.environ.get('MERZAAI_ASYNC_VIEWS') == '1'
+ASYNC_STORE_WORKERS = 8
+
+# Live change events (/api/events/, ASGI only): seconds between keepalive
+# comments, seconds between checks for other workers' writes, and events a
+# slow client may fall behind before it is disconnected
+EVENTS_KEEPALIVE = 15
+EVENTS_POLL_INTERVAL = 1
+EVENTS_QUEUE_SIZE = 100
+
+# Per-request cProfile: with this on, requests sent with ?profile=1 or an
+# X-Profile header are profiled into PROFILING_DIR, keeping the newest
+# PROFILING_KEEP files. Read at startup; off, the middleware is not loaded.
+PROFILING_ENABLED = os.environ.get('MERZAAI_PROFILING') == '1'
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_KEEP = 50
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -48,6 +105,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'merzaai.middleware.MetricsMiddleware',
+    'merzaai.middleware.ProfilingMiddleware',
+    'merzaai.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +118,19 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
 ]
 
+REST_FRAMEWORK = {
+    # orjson-backed when it is installed, stdlib json otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'merzaai.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'merzaai.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 
@@ -133,3 +206,21 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Fraction of the API's debug and info log messages that are written out;
+# warnings and errors always are (see merzaai.logs)
+LOG_SAMPLE_RATE = 1.0 if DEBUG else 0.1
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample': {'()': 'merzaai.logs.SampleFilter', 'rate': LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'filters': ['sample']},
+    },
+    'loggers': {
+        'merzaai': {'handlers': ['console'], 'level': 'DEBUG' if DEBUG else 'INFO'},
+    },
+}
@@ -14,28 +14,37 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from merzaai.views import * 
 
 urlpatterns = [
-    path('api/leads/', leads_api, name='leads-api'),
+    path('api/leads/', leads_api_async if settings.ASYNC_VIEWS else leads_api, name='leads-api'),
     path('api/edit/', edit_api, name='edit-api'),
     path('api/leads/add/', add_lead_api, name='add-lead-api'),
+    path('api/leads/bulk/', bulk_leads_api, name='bulk-leads-api'),
+    path('api/leads/export/', export_leads_api, name='export-leads-api'),
+    path('api/leads/import/', import_leads_api, name='import-leads-api'),
     path('api/leads/<int:lead_id>/convert/', convert_lead_to_customer, name='convert_lead_to_customer'),
     path('api/leads/<int:lead_id>/delete/', delete_lead_api, name='delete-lead-api'),
-    path('api/customers/', customers_api, name='leads-api'),
+    path('api/customers/', customers_api_async if settings.ASYNC_VIEWS else customers_api, name='leads-api'),
     path('api/customers/edit/', edit_customer_api, name='edit-customer-api'),
     path('api/customers/add/', add_customer_api, name='add-customer-api'),
+    path('api/customers/bulk/', bulk_customers_api, name='bulk-customers-api'),
+    path('api/customers/export/', export_customers_api, name='export-customers-api'),
+    path('api/customers/import/', import_customers_api, name='import-customers-api'),
     path('api/customers/<int:customer_id>/delete/', delete_customer_api, name='delete-customer-api'),
-    path('api/invoices/', invoices_api, name='invoices-api'),
+    path('api/customers/<int:customer_id>/invoices/', customer_invoices_api, name='customer-invoices-api'),
+    path('api/invoices/', invoices_api_async if settings.ASYNC_VIEWS else invoices_api, name='invoices-api'),
     path('api/invoices/add/', add_invoice_api, name='add-invoice-api'),
     path('api/invoices/add-custom/', add_custom_invoice_api, name='add_custom_invoice'),
+    path('api/invoices/bulk/', bulk_invoices_api, name='bulk-invoices-api'),
     path('api/invoices/edit/', edit_invoice_api, name='edit-invoice-api'),
     path('api/invoices/<int:invoice_id>/delete/', delete_invoice_api, name='delete-invoice-api'),
     path('api/invoices/<int:invoice_id>/mark-sent/', mark_invoice_sent, name='mark_invoice_sent'),
     path('api/invoices/<int:invoice_id>/mark-paid/', mark_invoice_paid_api, name='mark-invoice-paid-api'),
-    path('api/invoices/summary/', invoice_summary_api, name='invoice_summary'),
+    path('api/invoices/summary/', invoice_summary_api_async if settings.ASYNC_VIEWS else invoice_summary_api, name='invoice_summary'),
 
     path('api/chart-of-accounts/', chart_of_accounts_api, name='chart_of_accounts'),
     path('api/chart-of-accounts/add/', add_account_api, name='add_account'),
@@ -46,6 +55,10 @@ urlpatterns = [
     path('api/payments/', payments_api, name='payments-api'),
     path('api/payments/add/', add_payment_api, name='add-payment-api'),
 
-    path('api/dashboard/metrics/', dashboard_metrics_api, name='dashboard_metrics'),
+    path('api/dashboard/metrics/', dashboard_metrics_api_async if settings.ASYNC_VIEWS else dashboard_metrics_api, name='dashboard_metrics'),
+    path('api/dashboard/trends/', dashboard_trends_api, name='dashboard_trends'),
+    path('api/search/', search_api, name='search-api'),
+    path('api/metrics/', metrics_api, name='metrics-api'),
+    path('api/events/', events_api, name='events-api'),
 
 ]